@@ -0,0 +1,95 @@
+from typing import TYPE_CHECKING, Dict, Iterator, List
+
+import sqlite3
+import sys
+import warnings
+
+import numpy as np
+
+from utilities.vector_store import VectorStore, vectorStoreFromConfig
+from utilities.partitions import partition_name
+from manager.load_config import CONFIG
+
+from utilities.transform import sentence_vectors, token_sentence, vector_function_batch
+from utilities.query_cache import QueryCache, openQueryCache
+
+from colorama import Fore
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+
+def __load_model() -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer # Lazy import so bagging and cached queries run without torch
+    with warnings.catch_warnings(action="ignore"):
+        model: SentenceTransformer = SentenceTransformer(CONFIG["MODEL_NAME"])
+
+    return model
+
+def __query_cache() -> QueryCache | None:
+    if not CONFIG["QUERY_CACHE"]["ENABLED"]:
+        return None
+
+    # Everything that changes a query's vector
+    fingerprint: str = f"{CONFIG['MODEL_NAME']}:{CONFIG['VECTOR_FUNCTION']}:{CONFIG['VECTOR_TYPE']}:{CONFIG['VECTOR_SIZE']}"
+    return openQueryCache(CONFIG["QUERY_CACHE"]["PATH"], CONFIG["QUERY_CACHE"]["MAX_ENTRIES"], fingerprint)
+
+def __query_vectors(queries: List[List[str]]) -> np.ndarray:
+    if CONFIG["VECTOR_FUNCTION"] != "transformers":
+        return vector_function_batch(queries)
+
+    sentences: List[str] = [token_sentence(tokens) for tokens in queries]
+    cache: QueryCache | None = __query_cache()
+    vectors: Dict[str, np.ndarray] = {}
+    if cache is not None:
+        try:
+            vectors = cache.get_many(sentences)
+        except sqlite3.Error as e:
+            print(Fore.YELLOW + f"[WARNING]: Couldn't read the query cache: {e}", file=sys.stderr)
+
+    # The model is only loaded when a query isn't cached
+    missing: List[str] = [sentence for sentence in dict.fromkeys(sentences) if sentence not in vectors]
+    if len(missing) > 0:
+        encoded: Dict[str, np.ndarray] = dict(zip(missing, sentence_vectors(missing, __load_model())))
+        vectors.update(encoded)
+        if cache is not None:
+            try:
+                cache.put_many(encoded)
+            except sqlite3.Error as e:
+                print(Fore.YELLOW + f"[WARNING]: Couldn't write to the query cache: {e}", file=sys.stderr)
+
+    if cache is not None:
+        cache.close()
+
+    return np.stack([vectors[sentence] for sentence in sentences])
+
+
+def searchDirect(queries: List[List[str]], n: int, proj_dir: str | None = None) -> List[List[Dict]]:
+    """
+    Search the vector store straight from this process, loads the store on every call and the model whenever a
+    query vector isn't in the query cache
+    """
+    partition: str | None = partition_name(proj_dir) if proj_dir is not None else None
+    store: VectorStore = vectorStoreFromConfig(partition)
+
+    if partition is not None and not store.has_partition(partition):
+        return [[] for _ in queries]
+
+    search_vectors: np.ndarray = __query_vectors(queries)
+    output_fields: List[str] = ["token_code", "token_dir", "token_line", "token_path"]
+
+    return store.search(search_vectors, n, [partition] if partition is not None else None, output_fields)
+
+def queryAllDirect(page_size: int, proj_dir: str | None = None, path_prefix: str | None = None) -> Iterator[List[Dict]]:
+    """
+    Everything indexed page by page, optionally only one project's rows and only files under path_prefix
+    """
+    partition: str | None = partition_name(proj_dir) if proj_dir is not None else None
+    store: VectorStore = vectorStoreFromConfig(partition)
+
+    if partition is not None and not store.has_partition(partition):
+        return
+
+    output_fields: List[str] = ["token_code", "token_dir", "token_line", "token_path"]
+
+    yield from store.iterate(output_fields, page_size, [partition] if partition is not None else None, path_prefix)
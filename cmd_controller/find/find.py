@@ -1,94 +1,105 @@
-from typing import List, Set, Tuple, Dict
+from typing import Dict, List, Tuple
+import os
+import sys
+import tokenize
 
-import warnings
+from colorama import Fore
+import requests
 
-import pymilvus
-from utilities.setup_collection import setupCollection
-from sentence_transformers import SentenceTransformer
+from manager.load_config import CONFIG
 
 from utilities.tokenizer import tokenize_line
-from utilities.transform import vector_function
-
-from .print_entities import printEntities, printQuery
-
-
-def __lazy_setup() -> Tuple[pymilvus.Collection, SentenceTransformer | None]:
-    milvus_connection: pymilvus.Connections = pymilvus.connections.connect(
-        alias="default",
-        host="127.0.0.1",
-        port="19530"
-    )
-    
-    collection: pymilvus.Collection = setupCollection()
-
-    with warnings.catch_warnings(action="ignore"):
-        model: SentenceTransformer = SentenceTransformer("all-mpnet-base-v2")
-
-    return collection, model
-
-
-def baseFind(find_str: str, n: int):
-    collection: pymilvus.Collection
-    model: SentenceTransformer | None
-    collection, model = __lazy_setup()
 
+from .print_entities import printBatch, printEntities, printQuery
+from .write_rows import byScore, writeRows
+
+
+def __search(queries: List[List[str]], n: int, proj_dir: str | None) -> List[List[Dict]]:
+    if CONFIG["SEARCH_MODE"] in ("auto", "remote"):
+        from .remote import searchRemote
+        try:
+            return searchRemote(queries, n, proj_dir)
+        except requests.RequestException as e:
+            if CONFIG["SEARCH_MODE"] == "remote":
+                print(Fore.RED + f"[ERROR]: Couldn't reach the inference controller at {CONFIG['INFERENCE_CONTROLLER_URL']} start it with grep++_ic", file=sys.stderr)
+                raise e
+            if isinstance(e, requests.ConnectionError):
+                print(Fore.YELLOW + "[WARNING]: Inference controller not running, searching directly (slower)", file=sys.stderr)
+            else:
+                # Busy, slow or failing inference controller
+                print(Fore.YELLOW + f"[WARNING]: Inference controller search failed ({e}), searching directly (slower)", file=sys.stderr)
+
+    from .direct import searchDirect # Lazy import to avoid loading pymilvus and torch when not needed
+    return searchDirect(queries, n, proj_dir)
+
+
+def __print_results(results: List[Dict], output_format: str):
+    try:
+        if output_format == "pretty":
+            printEntities(byScore(results))
+        else:
+            writeRows([byScore(results)], output_format)
+    except BrokenPipeError:
+        __close_stdout()
+
+def __close_stdout():
+    # The reader went away (e.g. piped into head), drop the rest of the output instead of failing on exit
+    devnull: int = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+
+def baseFind(find_str: str, n: int, output_format: str = "pretty"):
     tokenized_str: List = tokenize_line(find_str)
-    search_vector: List = vector_function([t["token_type"] for t in tokenized_str], model).flatten().tolist()
-
-    search_params: Dict = {"metric_type": "L2", "params": {"nprobe": 10}}
-    output_fields: List[str] = ["token_code", "token_dir", "token_line", "token_path"]
-
-    res = collection.search(
-        data=[search_vector],
-        anns_field="token_vector",
-        param=search_params,
-        limit=n,
-        output_fields=output_fields
-    )
-
-    results: Set = set()
-    for aux in res: #type: ignore
-        for entity in aux:
-            results.add(entity)
+    results: List[List[Dict]] = __search([[t["token_type"] for t in tokenized_str]], n, None)
 
-    printEntities(results)
-
-def projectFind(find_str: str, n: int, proj_dir: str):
-    collection: pymilvus.Collection
-    model: SentenceTransformer | None
-    collection, model = __lazy_setup()
+    __print_results(results[0], output_format)
 
+def projectFind(find_str: str, n: int, proj_dir: str, output_format: str = "pretty"):
     tokenized_str: List = tokenize_line(find_str)
-    search_vector: List = vector_function([t["token_type"] for t in tokenized_str], model).flatten().tolist()
-
-    search_params: Dict = {"metric_type": "L2", "params": {"nprobe": 10}}
-    output_fields: List[str] = ["token_code", "token_dir", "token_line", "token_path"]
-
-    res = collection.search(
-        data=[search_vector],
-        anns_field="token_vector",
-        param=search_params,
-        limit=n,
-        output_fields=output_fields,
-        expr=f"token_dir == \"{proj_dir}\""
-    )
-
-    results: Set = set()
-    for aux in res: #type: ignore
-        for entity in aux:
-            results.add(entity)
-
-    printEntities(results)
-
-def findAll():
-    collection: pymilvus.Collection
-    collection, _ = __lazy_setup()
-
-    output_fields: List[str] = ["token_code", "token_dir", "token_line", "token_path"]
-
-    res = collection.query(
-        output_fields=output_fields,
-        expr=f"token_id >= \"0\""
-    )
-
-    printQuery(res)
+    results: List[List[Dict]] = __search([[t["token_type"] for t in tokenized_str]], n, proj_dir)
+
+    __print_results(results[0], output_format)
+
+def batchFind(queries_file: str, n: int, proj_dir: str | None = None, output_format: str = "pretty"):
+    """
+    Search every line of queries_file ("-" reads stdin) in one batch, results are tagged with the index of their
+    line starting at 0. Blank lines and lines that can't be tokenized have no results
+    """
+    if queries_file == "-":
+        lines: List[str] = sys.stdin.read().splitlines()
+    else:
+        with open(queries_file, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+
+    queries: List[Tuple[int, str]] = []
+    query_tokens: List[List[str]] = []
+    for index, line in enumerate(lines):
+        if line.strip() == "":
+            continue
+        try:
+            tokenized_str: List = tokenize_line(line.strip())
+        except (tokenize.TokenError, SyntaxError) as e:
+            print(Fore.YELLOW + f"[WARNING]: Skipping query {index}, couldn't tokenize it: {e}", file=sys.stderr)
+            continue
+        queries.append((index, line.strip()))
+        query_tokens.append([t["token_type"] for t in tokenized_str])
+
+    results: List[List[Dict]] = __search(query_tokens, n, proj_dir) if len(queries) > 0 else []
+
+    try:
+        if output_format == "pretty":
+            printBatch(queries, [byScore(entities) for entities in results])
+        else:
+            writeRows(([{"query": index, **tity} for tity in byScore(entities)] for (index, _), entities in zip(queries, results)), output_format)
+    except BrokenPipeError:
+        __close_stdout()
+
+def findAll(page_size: int, proj_dir: str | None = None, path_prefix: str | None = None, output_format: str = "pretty"):
+    from .direct import queryAllDirect
+    try:
+        if output_format == "pretty":
+            printQuery(queryAllDirect(page_size, proj_dir, path_prefix))
+        else:
+            writeRows(queryAllDirect(page_size, proj_dir, path_prefix), output_format)
+    except BrokenPipeError:
+        __close_stdout()
@@ -1,37 +1,23 @@
-from typing import Any, Dict, Set
+from typing import Dict, Iterable, List, TextIO, Tuple
+import sys
 
-from colorama import Fore
+from colorama import Fore, Style
 
-def printEntities(entities: Set):
-    grouped_tities: Dict = {}
-    for e in entities:
-        tity = e.entity
-
-        if tity.token_dir not in grouped_tities:
-            grouped_tities[tity.token_dir] = {}
-
-        if tity.token_path not in grouped_tities[tity.token_dir]:
-            grouped_tities[tity.token_dir][tity.token_path] = []
-
-        grouped_tities[tity.token_dir][tity.token_path].append({"line": tity.token_line, "code": tity.token_code})
+def __project_line(proj_dir: str) -> str:
+    return Fore.GREEN + f"[PROJECT DIR]: {proj_dir}" + Style.RESET_ALL + "\n"
 
-    for proj_dir in grouped_tities:
-        print(Fore.GREEN + f"[PROJECT DIR]: {proj_dir}")
+def __file_line(file_path: str) -> str:
+    return "\t" + Fore.YELLOW + f"[FILE PATH]: {file_path}" + Style.RESET_ALL + "\n"
 
-        for file_path in grouped_tities[proj_dir]:
-            print("\t", end="")
-            print(Fore.YELLOW + f"[FILE PATH]: {file_path}")
+def __code_line(line: int, code: str) -> str:
+    return "\t\t" + Fore.BLUE + f"[{line}]: " + Style.RESET_ALL + f"{code}\n"
 
-            for code_line in grouped_tities[proj_dir][file_path]:
-                print("\t\t", end="")
-                print(Fore.BLUE + f"[{code_line['line']}]: ", end="")
-                print(f"{code_line['code']}")
-            
-def printQuery(entities: Any):
+def printEntities(entities: List[Dict], out: TextIO = sys.stdout):
+    """
+    Print results grouped by project and file, groups come in the order of their best hit
+    """
     grouped_tities: Dict = {}
-    for e in entities:
-        tity = e
-
+    for tity in entities:
         if tity["token_dir"] not in grouped_tities:
             grouped_tities[tity["token_dir"]] = {}
 
@@ -40,14 +26,49 @@ def printQuery(entities: Any):
 
         grouped_tities[tity["token_dir"]][tity["token_path"]].append({"line": tity["token_line"], "code": tity["token_code"]})
 
+    lines: List[str] = []
     for proj_dir in grouped_tities:
-        print(Fore.GREEN + f"[PROJECT DIR]: {proj_dir}")
+        lines.append(__project_line(proj_dir))
 
         for file_path in grouped_tities[proj_dir]:
-            print("\t", end="")
-            print(Fore.YELLOW + f"[FILE PATH]: {file_path}")
+            lines.append(__file_line(file_path))
 
             for code_line in grouped_tities[proj_dir][file_path]:
-                print("\t\t", end="")
-                print(Fore.BLUE + f"[{code_line['line']}]: ", end="")
-                print(f"{code_line['code']}")
+                lines.append(__code_line(code_line["line"], code_line["code"]))
+
+    out.write("".join(lines))
+    out.flush()
+
+def printBatch(queries: List[Tuple[int, str]], results: List[List[Dict]], out: TextIO = sys.stdout):
+    """
+    Print the results of every query of a batch under a header with the query's index and text
+    """
+    for (index, query), entities in zip(queries, results):
+        out.write(Fore.MAGENTA + f"[QUERY {index}]: {query}" + Style.RESET_ALL + "\n")
+        printEntities(entities, out)
+
+def printQuery(pages: Iterable[List[Dict]], out: TextIO = sys.stdout):
+    """
+    Print rows as their pages arrive, headers are repeated when a project or file shows up again in a later page
+    """
+    last_dir: str | None = None
+    last_path: str | None = None
+    for page in pages:
+        page.sort(key=lambda tity: (tity["token_dir"], tity["token_path"], tity["token_line"]))
+
+        lines: List[str] = []
+        for tity in page:
+            if tity["token_dir"] != last_dir:
+                lines.append(__project_line(tity["token_dir"]))
+                last_dir = tity["token_dir"]
+                last_path = None
+
+            if tity["token_path"] != last_path:
+                lines.append(__file_line(tity["token_path"]))
+                last_path = tity["token_path"]
+
+            lines.append(__code_line(tity["token_line"], tity["token_code"]))
+
+        # One write per page, colorama's wrapped stdout is slow per call
+        out.write("".join(lines))
+        out.flush()
@@ -0,0 +1,21 @@
+from typing import Dict, List
+
+import requests
+
+from manager.load_config import CONFIG
+
+
+def searchRemote(queries: List[List[str]], n: int, proj_dir: str | None = None) -> List[List[Dict]]:
+    """
+    Search through the running inference controller which already has the model and collection loaded.
+    Raises requests.ConnectionError when the inference controller isn't running, requests.Timeout when it doesn't
+    answer within REMOTE_TIMEOUT and requests.HTTPError when the search fails
+    """
+    response: requests.Response = requests.post(
+        f"{CONFIG['INFERENCE_CONTROLLER_URL']}/search_batch",
+        json={"queries": queries, "n": n, "project": proj_dir},
+        timeout=CONFIG["REMOTE_TIMEOUT"]
+    )
+    response.raise_for_status()
+
+    return response.json()["results"]
@@ -0,0 +1,61 @@
+from typing import BinaryIO, Callable, Dict, Iterable, List
+import io
+import json
+import sys
+
+# Bytes buffered before a write to stdout
+BUFFER_SIZE: int = 1 << 16
+
+TSV_ESCAPES: Dict[int, str] = {ord("\\"): "\\\\", ord("\t"): "\\t", ord("\n"): "\\n", ord("\r"): "\\r"}
+
+def __jsonl(tity: Dict) -> str:
+    query: Dict = {"query": tity["query"]} if "query" in tity else {}
+    return json.dumps({
+        **query,
+        "distance": tity.get("distance"),
+        "project": tity["token_dir"],
+        "path": tity["token_path"],
+        "line": tity["token_line"],
+        "code": tity["token_code"]
+    }, ensure_ascii=False) + "\n"
+
+def __tsv(tity: Dict) -> str:
+    distance: str = "" if tity.get("distance") is None else repr(float(tity["distance"]))
+    query: List[str] = [str(tity["query"])] if "query" in tity else []
+    return "\t".join([
+        *query,
+        distance,
+        tity["token_dir"].translate(TSV_ESCAPES),
+        tity["token_path"].translate(TSV_ESCAPES),
+        str(tity["token_line"]),
+        tity["token_code"].translate(TSV_ESCAPES)
+    ]) + "\n"
+
+def __plain(tity: Dict) -> str:
+    # grep -n style, one line per result
+    query: str = f"{tity['query']}:" if "query" in tity else ""
+    return f"{query}{tity['token_path']}:{tity['token_line']}:{tity['token_code'].rstrip()}\n"
+
+def byScore(entities: List[Dict]) -> List[Dict]:
+    """
+    Hits ordered by distance, ties broken by location so the same results always print in the same order
+    """
+    return sorted(entities, key=lambda tity: (tity["distance"], tity["token_dir"], tity["token_path"], tity["token_line"]))
+
+def writeRows(pages: Iterable[List[Dict]], output_format: str, out: BinaryIO | None = None):
+    """
+    Write rows as jsonl (distance, project, path, line, code per object), tsv (the same columns, tabs and newlines
+    escaped) or plain (path:line:code). Rows without a distance (find --all) get null or an empty column, rows of
+    batch searches start with the index of their query
+    """
+    formatters: Dict[str, Callable[[Dict], str]] = {"jsonl": __jsonl, "tsv": __tsv, "plain": __plain}
+    formatter: Callable[[Dict], str] = formatters[output_format]
+
+    sys.stdout.flush()
+    writer: io.BufferedWriter = io.BufferedWriter(out if out is not None else sys.stdout.buffer, buffer_size=BUFFER_SIZE) #type: ignore
+    try:
+        for page in pages:
+            writer.write("".join(map(formatter, page)).encode("utf-8"))
+        writer.flush()
+    finally:
+        writer.detach()
@@ -11,11 +11,14 @@ def main():
         from find import find # Lazy import to avoid slowness
 
         if args["all"]:
-            find.findAll()
+            from manager.load_config import CONFIG
+            find.findAll(args["page_size"] or CONFIG["FIND_ALL_PAGE_SIZE"], args["project"], args["path_prefix"], args["format"])
+        elif args["queries_file"]:
+            find.batchFind(args["queries_file"], args["number"], args["project"], args["format"])
         elif args["project"]:
-            find.projectFind(args["find_str"], args["number"], args["project"])
+            find.projectFind(args["find_str"], args["number"], args["project"], args["format"])
         else:
-            find.baseFind(args["find_str"], args["number"])
+            find.baseFind(args["find_str"], args["number"], args["format"])
 
     return
 
@@ -11,13 +11,16 @@ def readArguments():
     parser_find: argparse.ArgumentParser = subparsers.add_parser("find", help="finding at it's finest")
     __build_parser_find(parser_find)
 
-    args = vars(parser.parse_args())
+    args = parser.parse_args()
+    if args.command == "find" and args.find_str is None and not args.all and args.queries_file is None:
+        parser_find.error("the find string is required unless --all or --queries-file is given")
 
-    return args
+    return vars(args)
 
 def __build_parser_find(parser_find: argparse.ArgumentParser) -> None:
     parser_find.add_argument(
         "find_str",
+        nargs="?",
         type=str,
         help="string to search for"
     )
@@ -35,7 +38,7 @@ def __build_parser_find(parser_find: argparse.ArgumentParser) -> None:
         "-p",
         required=False,
         type=str,
-        help="search for the string only within a specific project (if the project hasn't been indexed by grep++ recently results may be outdated)"
+        help="search for the string only within a specific project, with --all only show this project's index (if the project hasn't been indexed by grep++ recently results may be outdated)"
     )
     parser_find.add_argument(
         "--all",
@@ -44,3 +47,29 @@ def __build_parser_find(parser_find: argparse.ArgumentParser) -> None:
         action="store_true",
         help="show everything that grep++ has indexed, find string will be ignored (may be outdated if projects haven't been recently indexed by grep++)"
     )
+    parser_find.add_argument(
+        "--queries-file",
+        "-q",
+        required=False,
+        type=str,
+        help="search for every line of this file in one batch (- reads the lines from stdin), results are tagged with the index of their line starting at 0"
+    )
+    parser_find.add_argument(
+        "--format",
+        "-f",
+        choices=["pretty", "jsonl", "tsv", "plain"],
+        default="pretty",
+        help="output format, pretty groups results by project and file, jsonl and tsv print one result per line with its distance, project, path, line and code, plain prints path:line:code"
+    )
+    parser_find.add_argument(
+        "--path-prefix",
+        required=False,
+        type=str,
+        help="with --all only show files whose path starts with this prefix"
+    )
+    parser_find.add_argument(
+        "--page-size",
+        required=False,
+        type=int,
+        help="with --all number of rows fetched from the vector store at a time, default is FIND_ALL_PAGE_SIZE in config.yaml"
+    )
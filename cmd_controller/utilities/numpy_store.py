@@ -0,0 +1,154 @@
+from typing import Dict, Iterator, List, Tuple
+import os
+import sqlite3
+
+import numpy as np
+
+from utilities.vector_store import VectorStore
+
+from colorama import Fore
+
+METADATA_FIELDS: List[str] = ["token_id", "token_code", "token_path", "token_line", "token_dir"]
+
+# Rows scored at once during a search, bounds the memory of the distance matrices
+SEARCH_CHUNK_ROWS: int = 65536
+# Stay below sqlite's bound parameter limit
+SQL_CHUNK_SIZE: int = 500
+
+POPCOUNT: np.ndarray = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+def __squared_l2(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    distances: np.ndarray = (queries*queries).sum(axis=1)[:, None] - 2*queries@vectors.T + (vectors*vectors).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+def __hamming(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    return np.stack([POPCOUNT[np.bitwise_xor(vectors, query)].sum(axis=1) for query in queries]).astype(np.float32)
+
+def distances(queries: np.ndarray, vectors: np.ndarray, binary: bool) -> np.ndarray:
+    """
+    (num_queries, num_vectors) squared L2 or hamming distances, the distances milvus reports
+    """
+    return __hamming(queries, vectors) if binary else __squared_l2(queries, vectors)
+
+def merge_top_k(best_distances: np.ndarray, best_slots: np.ndarray, chunk_distances: np.ndarray, slots: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    all_distances: np.ndarray = np.concatenate([best_distances, chunk_distances], axis=1)
+    all_slots: np.ndarray = np.concatenate([best_slots, np.broadcast_to(slots, chunk_distances.shape)], axis=1)
+    if all_distances.shape[1] > k:
+        top: np.ndarray = np.argpartition(all_distances, k - 1, axis=1)[:, :k]
+        all_distances = np.take_along_axis(all_distances, top, axis=1)
+        all_slots = np.take_along_axis(all_slots, top, axis=1)
+    return all_distances, all_slots
+
+
+class NumpyStore(VectorStore):
+    """
+    Read only view of the inference controller's numpy store, safe to open while the inference controller writes to it
+    """
+
+    def __init__(self, path: str, vector_type: str, vector_size: int, nprobe: int):
+        self.path: str = os.path.expanduser(path)
+        self.binary: bool = vector_type == "binary_vector"
+        self.dtype: type = np.uint8 if self.binary else np.float32
+        self.width: int = vector_size//8 if self.binary else vector_size
+        self.nprobe: int = nprobe
+
+        metadata_path: str = os.path.join(self.path, "metadata.sqlite")
+        if not os.path.exists(metadata_path):
+            print(Fore.RED + f"[ERROR]: Vector store \"{self.path}\" doesn't exist, start grep++_ic and index a project first")
+            raise RuntimeError(f"vector store \"{self.path}\" does not exist")
+
+        self.__db: sqlite3.Connection = sqlite3.connect(f"file:{metadata_path}?mode=ro", uri=True)
+        self.__partitions: Dict[str, int] = {name: partition_id for partition_id, name in self.__db.execute("SELECT id, name FROM partitions")}
+
+        # Slots are read before the vectors are mapped, the inference controller grows the file before using new slots
+        slot_partitions: np.ndarray = np.array(self.__db.execute("SELECT slot, partition_id FROM rows").fetchall(), dtype=np.int64).reshape(-1, 2)
+        vectors_path: str = os.path.join(self.path, "vectors.u8" if self.binary else "vectors.f32")
+        capacity: int = os.path.getsize(vectors_path)//(self.width*np.dtype(self.dtype).itemsize)
+        self.__vectors: np.memmap = np.memmap(vectors_path, dtype=self.dtype, mode="r", shape=(capacity, self.width))
+
+        self.__partition_of: np.ndarray = np.full(capacity, -1, dtype=np.int32)
+        self.__partition_of[slot_partitions[:, 0]] = slot_partitions[:, 1]
+
+        self.__centroids: np.ndarray | None = None
+        self.__assignments: np.ndarray = np.full(capacity, -1, dtype=np.int32)
+        ivf_path: str = os.path.join(self.path, "ivf.npz")
+        if not self.binary and os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self.__centroids = ivf["centroids"]
+                assignments: np.ndarray = ivf["assignments"]
+            count: int = min(len(assignments), capacity)
+            self.__assignments[:count] = assignments[:count]
+
+    def has_partition(self, partition: str) -> bool:
+        return partition in self.__partitions
+
+    def __rows(self, where: str, params: List, output_fields: List[str], extra: str = "") -> List[Dict]:
+        columns: List[str] = [field for field in output_fields if field in METADATA_FIELDS]
+        res: List[Dict] = []
+        for row in self.__db.execute(f"SELECT {', '.join(['slot'] + columns)} FROM rows WHERE {where} {extra}", params):
+            entity: Dict = dict(zip(columns, row[1:]))
+            entity["slot"] = row[0]
+            res.append(entity)
+        return res
+
+    def __candidates(self, query: np.ndarray, allowed: np.ndarray) -> np.ndarray:
+        if self.__centroids is None:
+            return np.flatnonzero(allowed)
+
+        # Rows of the nprobe closest clusters plus the rows added since the index was last saved
+        nlist: int = len(self.__centroids)
+        probes: np.ndarray = np.argpartition(distances(query[None, :], self.__centroids, False)[0], min(self.nprobe, nlist) - 1)[:self.nprobe]
+        probed: np.ndarray = np.zeros(nlist + 1, dtype=bool)
+        probed[probes] = True
+        probed[-1] = True
+        return np.flatnonzero(allowed & probed[self.__assignments])
+
+    def search(self, vectors: np.ndarray, limit: int, partition_names: List[str] | None, output_fields: List[str]) -> List[List[Dict]]:
+        queries: np.ndarray = np.asarray(vectors, dtype=self.dtype).reshape(len(vectors), self.width)
+        if partition_names is None:
+            allowed: np.ndarray = self.__partition_of >= 0
+        else:
+            allowed = np.isin(self.__partition_of, [self.__partitions[name] for name in partition_names if name in self.__partitions])
+
+        hits: List[Tuple[np.ndarray, np.ndarray]] = []
+        for query in queries:
+            candidates: np.ndarray = self.__candidates(query, allowed)
+            best_distances: np.ndarray = np.empty((1, 0), dtype=np.float32)
+            best_slots: np.ndarray = np.empty((1, 0), dtype=np.int64)
+            for start in range(0, len(candidates), SEARCH_CHUNK_ROWS):
+                slots: np.ndarray = candidates[start:start+SEARCH_CHUNK_ROWS]
+                best_distances, best_slots = merge_top_k(best_distances, best_slots, distances(query[None, :], self.__vectors[slots], self.binary), slots, limit)
+            order: np.ndarray = np.argsort(best_distances[0], kind="stable")
+            hits.append((best_distances[0][order], best_slots[0][order]))
+
+        found: List[int] = sorted({int(slot) for _, slots in hits for slot in slots})
+        entities: Dict[int, Dict] = {}
+        for start in range(0, len(found), SQL_CHUNK_SIZE):
+            chunk: List[int] = found[start:start+SQL_CHUNK_SIZE]
+            for entity in self.__rows(f"slot IN ({','.join('?'*len(chunk))})", chunk, output_fields):
+                entities[entity.pop("slot")] = entity
+
+        return [[{"distance": float(distance), **entities[int(slot)]} for distance, slot in zip(query_distances, query_slots) if int(slot) in entities] for query_distances, query_slots in hits]
+
+    def iterate(self, output_fields: List[str], batch_size: int, partition_names: List[str] | None = None, path_prefix: str | None = None) -> Iterator[List[Dict]]:
+        # Keyset pagination on the slot, every page is a bounded primary key range scan
+        where: str = "slot > ?"
+        params: List = []
+        if partition_names is not None:
+            partition_ids: List[int] = [self.__partitions[name] for name in partition_names if name in self.__partitions]
+            where += f" AND partition_id IN ({','.join('?'*len(partition_ids))})"
+            params.extend(partition_ids)
+        if path_prefix is not None:
+            where += " AND substr(token_path, 1, ?) = ?"
+            params.extend([len(path_prefix), path_prefix])
+
+        last_slot: int = -1
+        while True:
+            page: List[Dict] = self.__rows(where, [last_slot, *params, batch_size], output_fields, "ORDER BY slot LIMIT ?")
+            if len(page) == 0:
+                return
+            last_slot = page[-1]["slot"]
+            for entity in page:
+                del entity["slot"]
+            yield page
@@ -0,0 +1,7 @@
+import hashlib
+
+def partition_name(proj_dir: str) -> str:
+    """
+    Name of the partition holding a project's rows, must match the inference controller's naming
+    """
+    return "dir_" + hashlib.sha1(proj_dir.encode()).hexdigest()
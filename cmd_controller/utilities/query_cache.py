@@ -0,0 +1,73 @@
+from typing import Dict, List
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from colorama import Fore
+
+# Stay below sqlite's bound parameter limit
+SQL_CHUNK_SIZE: int = 500
+
+class QueryCache:
+    """
+    Query vectors of past searches kept in a sqlite file, keyed by the hash of the query sentence and a fingerprint
+    of everything that changes its vector. The least recently used vectors are evicted past max_entries
+    """
+
+    def __init__(self, path: str, max_entries: int, fingerprint: str):
+        self.path: str = os.path.expanduser(path)
+        self.max_entries: int = max_entries
+        self.fingerprint: str = fingerprint
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.__db: sqlite3.Connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS vectors (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)")
+
+    def __key(self, sentence: str) -> bytes:
+        return hashlib.sha256(f"{self.fingerprint}\0{sentence}".encode()).digest()
+
+    def get_many(self, sentences: List[str]) -> Dict[str, np.ndarray]:
+        keys: Dict[bytes, str] = {self.__key(sentence): sentence for sentence in sentences}
+        found: Dict[str, np.ndarray] = {}
+        key_list: List[bytes] = list(keys)
+        for start in range(0, len(key_list), SQL_CHUNK_SIZE):
+            chunk: List[bytes] = key_list[start:start+SQL_CHUNK_SIZE]
+            for key, vector in self.__db.execute(f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?'*len(chunk))})", chunk):
+                found[keys[key]] = np.frombuffer(vector, dtype=np.float32)
+
+        if len(found) > 0:
+            now: float = time.time()
+            self.__db.executemany("UPDATE vectors SET last_used = ? WHERE key = ?", [(now, self.__key(sentence)) for sentence in found])
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        now: float = time.time()
+        self.__db.execute("BEGIN IMMEDIATE")
+        self.__db.executemany(
+            "INSERT OR REPLACE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)",
+            [(self.__key(sentence), np.asarray(vector, dtype=np.float32).tobytes(), now) for sentence, vector in vectors.items()]
+        )
+        (count,) = self.__db.execute("SELECT COUNT(*) FROM vectors").fetchone()
+        if count > self.max_entries:
+            self.__db.execute("DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used LIMIT ?)", [count - self.max_entries])
+        self.__db.execute("COMMIT")
+
+    def close(self) -> None:
+        self.__db.close()
+
+
+def openQueryCache(path: str, max_entries: int, fingerprint: str) -> QueryCache | None:
+    """
+    The query cache or None when it can't be opened, searches then encode every query
+    """
+    try:
+        return QueryCache(path, max_entries, fingerprint)
+    except (OSError, sqlite3.Error) as e:
+        print(Fore.YELLOW + f"[WARNING]: Couldn't open the query cache at {path}, queries won't be cached: {e}", file=sys.stderr)
+        return None
@@ -2,13 +2,19 @@ from pymilvus import Collection, utility
 
 from colorama import Fore
 
-def setupCollection() -> Collection:
+def setupCollection(partition: str | None = None) -> Collection:
+    """
+    Open the TOKENS collection and load it, only the given partition is loaded when there is one
+    """
     if not utility.has_collection("TOKENS"):
         print(Fore.RED + "[ERROR]: milvus collection not instantiated please initiate vector database before trying to find")
         raise RuntimeError("milvus collection \"TOKENS\" does not exist")
     else:
         col = Collection("TOKENS")
 
-    col.load()
+    if partition is None:
+        col.load()
+    elif col.has_partition(partition):
+        col.load(partition_names=[partition])
 
     return col
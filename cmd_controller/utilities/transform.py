@@ -1,23 +1,92 @@
-from typing import List
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Dict, List
 from manager.load_config import CONFIG
-from torch import Tensor
 import numpy as np
+import zlib
 
-def __transform(sentence: str, model: SentenceTransformer) -> np.ndarray:
-    res: List[Tensor] | np.ndarray | Tensor = model.encode(sentence, convert_to_numpy=True)
+if TYPE_CHECKING:
+    # Only needed for annotations so the bagging vectorizer can run without torch installed
+    from sentence_transformers import SentenceTransformer
+    from torch import Tensor
+
+def __transform(sentences: List[str], model: "SentenceTransformer") -> np.ndarray:
+    res: "List[Tensor] | np.ndarray | Tensor" = model.encode(sentences, convert_to_numpy=True)
     assert(isinstance(res, np.ndarray))
 
     return res
 
-def __bagging(tokens: List[str]) -> np.ndarray:
-    return np.zeros([768])
+__token_type_ids: Dict[str, int] = {}
+
+def __token_type_id(token_type: str) -> int:
+    token_type_id: int | None = __token_type_ids.get(token_type)
+    if token_type_id is None:
+        # crc32 is stable across processes unlike hash() so vectors stay comparable between runs
+        token_type_id = zlib.crc32(token_type.encode()) + 1
+        __token_type_ids[token_type] = token_type_id
+    return token_type_id
+
+def __mix(h: np.ndarray) -> np.ndarray:
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xff51afd7ed558ccd)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xc4ceb9fe1a85ec53)
+    return h ^ (h >> np.uint64(33))
+
+def __bagging_batch(tokens_batch: List[List[str]]) -> np.ndarray:
+    """
+    Bag of hashed token type n-grams, must stay identical to the inference controller's so queries match indexed lines
+    """
+    vector_size: int = CONFIG["VECTOR_SIZE"]
+    lengths: np.ndarray = np.array([len(tokens) for tokens in tokens_batch], dtype=np.int64)
+    ids: np.ndarray = np.array([__token_type_id(tok) for tokens in tokens_batch for tok in tokens], dtype=np.uint64)
+    line_of: np.ndarray = np.repeat(np.arange(len(tokens_batch)), lengths)
+
+    bits: np.ndarray = np.zeros([len(tokens_batch), vector_size], dtype=bool)
+    with np.errstate(over="ignore"):
+        for n in range(1, CONFIG["BAGGING_NGRAM"] + 1):
+            num_grams: int = len(ids) - n + 1
+            if num_grams <= 0:
+                break
+
+            # Only keep n-grams whose first and last token are on the same line
+            valid: np.ndarray = line_of[:num_grams] == line_of[n-1:]
+            h: np.ndarray = np.full(num_grams, n, dtype=np.uint64)
+            for k in range(n):
+                h = __mix(h*np.uint64(0x100000001b3) + ids[k:k+num_grams])
+
+            bits[line_of[:num_grams][valid], (h[valid] % np.uint64(vector_size)).astype(np.int64)] = True
+
+    if CONFIG["VECTOR_TYPE"] == "binary_vector":
+        return np.packbits(bits, axis=1)
+    return bits.astype(np.float32)
+
+def to_milvus_vector(vector: np.ndarray) -> List | bytes:
+    """
+    Convert a vector into the format pymilvus expects for the configured vector type
+    """
+    if CONFIG["VECTOR_TYPE"] == "binary_vector":
+        return vector.tobytes()
+    return vector.flatten().tolist()
+
+
+def token_sentence(tokens: List[str]) -> str:
+    """
+    Sentence the transformer encodes for a token list
+    """
+    return " ".join([tok.replace("_", " ").lower() for tok in tokens])
+
+def sentence_vectors(sentences: List[str], model: "SentenceTransformer") -> np.ndarray:
+    return __transform(sentences, model)
 
+def vector_function(tokens: List[str], model: "SentenceTransformer | None" = None) -> np.ndarray:
+    return vector_function_batch([tokens], model)[0]
 
-def vector_function(tokens: List[str], model: SentenceTransformer | None = None) -> np.ndarray:
+def vector_function_batch(tokens_batch: List[List[str]], model: "SentenceTransformer | None" = None) -> np.ndarray:
+    """
+    Vectorize many token lists at once, returns a matrix with one row per token list
+    """
     if CONFIG["VECTOR_FUNCTION"] == "transformers":
         if model is None:
             raise ValueError("model passed in is not a valid SentenceTransformer")
-        return __transform(" ".join([tok.replace("_", " ").lower() for tok in tokens]), model)
+        return __transform([token_sentence(tokens) for tokens in tokens_batch], model)
     else:
-        return __bagging(tokens)
+        return __bagging_batch(tokens_batch)
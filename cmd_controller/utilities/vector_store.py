@@ -0,0 +1,94 @@
+from typing import Dict, Iterator, List
+import json
+
+import numpy as np
+
+from manager.load_config import CONFIG
+
+class VectorStore:
+    """
+    Read side of the inference controller's vector store, vectors are float32 matrices or packed uint8 matrices
+    for binary vectors
+    """
+
+    def has_partition(self, partition: str) -> bool:
+        raise NotImplementedError
+
+    def search(self, vectors: np.ndarray, limit: int, partition_names: List[str] | None, output_fields: List[str]) -> List[List[Dict]]:
+        """
+        Nearest rows of every vector ordered by distance, each hit has its "distance" and output fields
+        """
+        raise NotImplementedError
+
+    def iterate(self, output_fields: List[str], batch_size: int, partition_names: List[str] | None = None, path_prefix: str | None = None) -> Iterator[List[Dict]]:
+        """
+        Every row page by page without loading the whole store, pages hold up to batch_size rows. Only rows whose
+        token_path starts with path_prefix when there is one
+        """
+        raise NotImplementedError
+
+
+class MilvusStore(VectorStore):
+    def __init__(self, partition: str | None = None):
+        # Lazy imports so the numpy store runs without pymilvus
+        import pymilvus
+        from utilities.setup_collection import setupCollection
+
+        pymilvus.connections.connect(
+            alias="default",
+            host=CONFIG["VECTOR_STORE"]["MILVUS"]["HOST"],
+            port=CONFIG["VECTOR_STORE"]["MILVUS"]["PORT"]
+        )
+        self.collection: pymilvus.Collection = setupCollection(partition)
+
+    def has_partition(self, partition: str) -> bool:
+        return self.collection.has_partition(partition)
+
+    def search(self, vectors: np.ndarray, limit: int, partition_names: List[str] | None, output_fields: List[str]) -> List[List[Dict]]:
+        from utilities.transform import to_milvus_vector
+
+        search_params: Dict = {"metric_type": "L2" if CONFIG["VECTOR_TYPE"] == "float_vector" else "HAMMING", "params": CONFIG["SEARCH_PARAMS"]}
+        res = self.collection.search(
+            data=[to_milvus_vector(vector) for vector in vectors],
+            anns_field="token_vector",
+            param=search_params,
+            limit=limit,
+            output_fields=output_fields,
+            partition_names=partition_names
+        )
+
+        results: List[List[Dict]] = []
+        for hits in res: #type: ignore
+            results.append([{"distance": hit.distance, **{field: hit.entity.get(field) for field in output_fields}} for hit in hits])
+        return results
+
+    def iterate(self, output_fields: List[str], batch_size: int, partition_names: List[str] | None = None, path_prefix: str | None = None) -> Iterator[List[Dict]]:
+        # like only supports a trailing % as a prefix match, escape the wildcards of the prefix itself
+        expr: str | None = None
+        if path_prefix is not None:
+            pattern: str = path_prefix.replace("%", "\\%").replace("_", "\\_") + "%"
+            expr = f"token_path like {json.dumps(pattern)}"
+
+        iterator = self.collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields, partition_names=partition_names)
+        try:
+            while True:
+                page: List[Dict] = iterator.next()
+                if len(page) == 0:
+                    break
+                yield page
+        finally:
+            iterator.close()
+
+
+def vectorStoreFromConfig(partition: str | None = None) -> VectorStore:
+    """
+    Open the vector store configured in config.yaml, milvus only loads the given partition when there is one
+    """
+    if CONFIG["VECTOR_STORE"]["BACKEND"] == "milvus":
+        return MilvusStore(partition)
+
+    if CONFIG["VECTOR_STORE"]["BACKEND"] == "numpy":
+        from utilities.numpy_store import NumpyStore
+        return NumpyStore(CONFIG["VECTOR_STORE"]["NUMPY"]["PATH"], CONFIG["VECTOR_TYPE"], CONFIG["VECTOR_SIZE"], CONFIG["VECTOR_STORE"]["NUMPY"]["NPROBE"])
+
+    raise ValueError(f"unknown vector store backend \"{CONFIG['VECTOR_STORE']['BACKEND']}\"")
@@ -0,0 +1,199 @@
+from typing import Callable, Dict, Iterator, List, Tuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import threading
+import time
+
+# Prometheus' default buckets, in seconds
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def power_of_two_buckets(max_value: int) -> Tuple[float, ...]:
+    buckets: List[float] = [1]
+    while buckets[-1] < max_value:
+        buckets.append(buckets[-1]*2)
+    return tuple(buckets)
+
+REGISTRY: Dict[str, "Metric"] = {}
+
+def __escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def __format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+def format_sample(name: str, label_names: Tuple[str, ...], label_values: Tuple[str, ...], value: float) -> str:
+    if len(label_names) == 0:
+        return f"{name} {__format_value(value)}"
+    labels: str = ",".join(f"{label}=\"{__escape(str(label_value))}\"" for label, label_value in zip(label_names, label_values))
+    return f"{name}{{{labels}}} {__format_value(value)}"
+
+
+class Metric:
+    """
+    Base of the metrics served on /metrics, every metric registers itself under its name on creation.
+    Values are kept per tuple of label values
+    """
+    type: str = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        if name in REGISTRY:
+            raise ValueError(f"metric \"{name}\" is already registered")
+
+        self.name: str = name
+        self.help: str = help
+        self.label_names: Tuple[str, ...] = labels
+
+        self._lock: threading.Lock = threading.Lock()
+        self._function: Callable[[], Dict[Tuple[str, ...], float]] | None = None
+        REGISTRY[name] = self
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """
+        Read the values from function on every render instead of tracking them, for state kept elsewhere
+        """
+        self._function = function
+
+    def _check_labels(self, labels: Tuple[str, ...]) -> None:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"metric \"{self.name}\" expects labels {self.label_names} got {labels}")
+
+    def _values(self) -> Dict[Tuple[str, ...], float]:
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        values: Dict[Tuple[str, ...], float] = self._function() if self._function is not None else self._values()
+        return [format_sample(self.name, self.label_names, labels, value) for labels, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        # Unlabeled metrics are exported from the start, labeled ones once a label combination is used
+        self.__values: Dict[Tuple[str, ...], float] = {(): 0} if len(labels) == 0 else {}
+
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        self._check_labels(labels)
+        with self._lock:
+            self.__values[labels] = self.__values.get(labels, 0) + amount
+
+    def _values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self.__values)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        # Unlabeled metrics are exported from the start, labeled ones once a label combination is used
+        self.__values: Dict[Tuple[str, ...], float] = {(): 0} if len(labels) == 0 else {}
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        self._check_labels(labels)
+        with self._lock:
+            self.__values[labels] = value
+
+    def _values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self.__values)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # Per label values: count of every bucket (not cumulative) plus +Inf, sum of the observations
+        self.__counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.__sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        self._check_labels(labels)
+        i: int = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            counts: List[int] | None = self.__counts.get(labels)
+            if counts is None:
+                counts = [0]*(len(self.buckets) + 1)
+                self.__counts[labels] = counts
+            counts[i] += 1
+            self.__sums[labels] = self.__sums.get(labels, 0.0) + value
+
+    def snapshot(self, labels: Tuple[str, ...] = ()) -> Tuple[List[int], float]:
+        """
+        Count of every bucket (not cumulative) plus +Inf and the sum of the observations for the label values
+        """
+        with self._lock:
+            return list(self.__counts.get(labels, [0]*(len(self.buckets) + 1))), self.__sums.get(labels, 0.0)
+
+    @contextmanager
+    def time(self, labels: Tuple[str, ...] = ()) -> Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            counts: Dict[Tuple[str, ...], List[int]] = {labels: list(bucket_counts) for labels, bucket_counts in self.__counts.items()}
+            sums: Dict[Tuple[str, ...], float] = dict(self.__sums)
+
+        label_names: Tuple[str, ...] = self.label_names + ("le",)
+        lines: List[str] = []
+        for labels, bucket_counts in sorted(counts.items()):
+            cumulative: int = 0
+            for bound, count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative += count
+                lines.append(format_sample(f"{self.name}_bucket", label_names, labels + ("+Inf" if math.isinf(bound) else repr(float(bound)),), cumulative))
+            lines.append(format_sample(f"{self.name}_sum", self.label_names, labels, sums[labels]))
+            lines.append(format_sample(f"{self.name}_count", self.label_names, labels, cumulative))
+        return lines
+
+
+def render() -> str:
+    """
+    Every registered metric in the Prometheus text exposition format
+    """
+    lines: List[str] = []
+    for metric in REGISTRY.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body: bytes = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Scrapes would flood the monitoring output otherwise
+        return
+
+def start_http_server(host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve /metrics from a background thread
+    """
+    server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
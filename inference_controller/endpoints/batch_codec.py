@@ -0,0 +1,83 @@
+from typing import Dict, List
+import gzip
+
+import msgpack
+import numpy as np
+
+from endpoints.models import CodeLine, Token, TokenizedFile
+
+# Version of the /update_batch payload, bumped whenever the layout below changes
+BATCH_VERSION: int = 1
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+def decompress(body: bytes, content_encoding: str | None) -> bytes:
+    if content_encoding is None or content_encoding == "identity":
+        return body
+    if content_encoding == "gzip":
+        return gzip.decompress(body)
+    if content_encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise UnsupportedEncoding("zstd payloads need the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    raise UnsupportedEncoding(f"unsupported content encoding \"{content_encoding}\"")
+
+def __uint32s(buffer: bytes) -> np.ndarray:
+    return np.frombuffer(buffer, dtype="<u4")
+
+def __decode_file(proj_dir: str, token_types: List[str], file: Dict) -> TokenizedFile:
+    codes: List[str] = file["codes"]
+    lines: np.ndarray = __uint32s(file["lines"])
+    token_counts: np.ndarray = __uint32s(file["token_counts"])
+    type_ids: np.ndarray = np.frombuffer(file["token_types"], dtype="<u2")
+    token_strs: List[str] = file["token_strs"]
+    positions: np.ndarray = __uint32s(file["positions"]).reshape(-1, 4)
+
+    if not (len(codes) == len(lines) == len(token_counts)) or not (int(token_counts.sum()) == len(type_ids) == len(token_strs) == len(positions)):
+        raise ValueError(f"columns of \"{file['path']}\" have mismatched lengths")
+
+    # The payload is built by our own sender so the models are constructed without validation
+    code_lines: List[CodeLine] = []
+    start: int = 0
+    for code, line, count in zip(codes, lines.tolist(), token_counts.tolist()):
+        tokens: List[Token] = [
+            Token.model_construct(
+                token_type=token_types[type_id],
+                token_str=token_str,
+                start_pos=f"{position[0]},{position[1]}",
+                end_pos=f"{position[2]},{position[3]}"
+            )
+            for type_id, token_str, position in zip(type_ids[start:start+count].tolist(), token_strs[start:start+count], positions[start:start+count].tolist())
+        ]
+        code_lines.append(CodeLine.model_construct(code=code, line=line, tokens=tokens))
+        start += count
+
+    return TokenizedFile.model_construct(path=file["path"], dir=proj_dir, lines=code_lines)
+
+def decode_update_batch(body: bytes, content_encoding: str | None) -> List[TokenizedFile]:
+    """
+    Decode an /update_batch payload, a msgpack map of
+        version: BATCH_VERSION
+        dir: project directory of every file
+        token_types: vocabulary of the token types used in the batch
+        files: one map per file of
+            path: file path
+            codes: code of every line
+            lines, token_counts: little endian uint32 arrays with the line number and number of tokens of every line
+            token_types: little endian uint16 array with the vocabulary index of every token
+            token_strs: string of every token
+            positions: little endian uint32 array with start row, start column, end row, end column of every token
+    """
+    try:
+        batch: Dict = msgpack.unpackb(decompress(body, content_encoding), raw=False)
+        if batch.get("version") != BATCH_VERSION:
+            raise ValueError(f"unsupported batch version {batch.get('version')}")
+
+        return [__decode_file(batch["dir"], batch["token_types"], file) for file in batch["files"]]
+    except UnsupportedEncoding:
+        raise
+    except (ValueError, KeyError, TypeError, IndexError, OSError, msgpack.UnpackException) as e:
+        raise ValueError(f"malformed update batch: {e}")
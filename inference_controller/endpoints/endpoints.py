@@ -1,18 +1,78 @@
 from typing import Dict, List
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request, Response
+import asyncio
 
-from endpoints.models import TokenizedFile, FilePath
+from endpoints.models import TokenizedFile, FilePath, SearchQuery, SearchBatch
+from endpoints.ingest_queue import IngestJob
 from endpoints import service
+from manager import metrics
+from endpoints.batch_codec import UnsupportedEncoding, decode_update_batch
+from vectordb.transform import embedding_cache_stats
 
 router = APIRouter()
 
-@router.post("/update")
+@router.post("/update", status_code=202)
 async def update(request: Request, tokenized_file: TokenizedFile) -> Dict:
-    request.app.state.num_inserts_not_indexed = service.vectorize_file(request.app.state.tokens_collection, request.app.state.transformer_model, request.app.state.num_inserts_not_indexed, tokenized_file)
+    await request.app.state.ingest_queue.submit(IngestJob("update", tokenized_file.path, tokenized_file.dir, tokenized_file))
 
-    return {"status": "success"}
+    return {"status": "queued"}
 
-@router.post("/delete")
+@router.post("/update_batch", status_code=202)
+async def update_batch(request: Request) -> Dict:
+    """
+    Queue many files sent in one compact msgpack payload, see decode_update_batch for the layout
+    """
+    body: bytes = await request.body()
+    try:
+        with service.INGEST_STAGE_SECONDS.time(("decode",)):
+            tokenized_files: List[TokenizedFile] = await asyncio.to_thread(decode_update_batch, body, request.headers.get("content-encoding"))
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for tokenized_file in tokenized_files:
+        await request.app.state.ingest_queue.submit(IngestJob("update", tokenized_file.path, tokenized_file.dir, tokenized_file))
+
+    return {"status": "queued", "files": len(tokenized_files)}
+
+@router.post("/delete", status_code=202)
 async def delete(request: Request, file: FilePath) -> Dict:
-    service.delete_file(request.app.state.tokens_collection, file)
-    return {"status": "success"}
+    await request.app.state.ingest_queue.submit(IngestJob("delete", file.path, file.dir, file))
+    return {"status": "queued"}
+
+@router.post("/search")
+def search(request: Request, query: SearchQuery) -> Dict:
+    results: List[List[Dict]]
+    generation: str
+    results, generation = service.search(request.app.state.vector_store, request.app.state.partitions, request.app.state.transformer_model, request.app.state.micro_batcher, request.app.state.result_cache, request.app.state.generations, [query.token_types], query.n, query.project)
+    return {"results": results[0], "generation": generation}
+
+@router.post("/search_batch")
+def search_batch(request: Request, batch: SearchBatch) -> Dict:
+    results: List[List[Dict]]
+    generation: str
+    results, generation = service.search(request.app.state.vector_store, request.app.state.partitions, request.app.state.transformer_model, request.app.state.micro_batcher, request.app.state.result_cache, request.app.state.generations, batch.queries, batch.n, batch.project)
+    return {"results": results, "generation": generation}
+
+@router.get("/generation")
+async def generation(request: Request, project: str | None = None) -> Dict:
+    """
+    Current generation of a project (of every project without one), search results that came with the same
+    generation are still up to date
+    """
+    return {"project": project, "generation": request.app.state.generations.get(project)}
+
+@router.get("/status")
+async def status(request: Request) -> Dict:
+    return {
+        "ingest": request.app.state.ingest_queue.status(),
+        "flush": request.app.state.flush_policy.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "result_cache": request.app.state.result_cache.stats(),
+        "micro_batcher": request.app.state.micro_batcher.stats() if request.app.state.micro_batcher is not None else None
+    }
+
+@router.get("/metrics")
+def get_metrics() -> Response:
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
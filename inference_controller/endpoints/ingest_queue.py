@@ -0,0 +1,127 @@
+from typing import Callable, Dict, List, Set
+from collections import OrderedDict
+import asyncio
+import time
+
+from endpoints.models import FilePath, TokenizedFile
+from manager.metrics import Counter, Gauge, Histogram, power_of_two_buckets
+
+from colorama import Fore
+
+QUEUE_DEPTH: Gauge = Gauge("grep_ic_ingest_queue_depth", "Jobs waiting in the ingest queue")
+IN_FLIGHT: Gauge = Gauge("grep_ic_ingest_in_flight", "Jobs being processed by the ingest workers")
+JOBS: Counter = Counter("grep_ic_ingest_jobs_total", "Ingest jobs by outcome", labels=("result",))
+BATCH_FILES: Histogram = Histogram("grep_ic_ingest_batch_files", "Files processed together by an ingest worker", buckets=power_of_two_buckets(256))
+JOB_LAG_SECONDS: Histogram = Histogram("grep_ic_ingest_job_lag_seconds", "Time from a job being queued to it being applied", buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+class IngestJob:
+    def __init__(self, action: str, path: str, dir: str, payload: TokenizedFile | FilePath):
+        self.action: str = action
+        self.path: str = path
+        self.dir: str = dir
+        self.payload: TokenizedFile | FilePath = payload
+        self.enqueued_at: float = time.monotonic()
+
+
+class IngestQueue:
+    """
+    Queue of pending /update and /delete jobs drained by background workers. Only the newest job of a path
+    is kept while it waits and a path is never processed by two workers at the same time
+    """
+
+    def __init__(self, handler: Callable[[List[IngestJob]], None], num_workers: int, max_batch_files: int):
+        self.num_workers: int = num_workers
+        self.max_batch_files: int = max_batch_files
+
+        self.processed: int = 0
+        self.coalesced: int = 0
+        self.failed: int = 0
+        self.last_lag: float = 0.0
+
+        self.__handler: Callable[[List[IngestJob]], None] = handler
+        self.__jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self.__in_flight: Set[str] = set()
+        self.__cond: asyncio.Condition = asyncio.Condition()
+        self.__workers: List[asyncio.Task] = []
+
+        QUEUE_DEPTH.set_function(lambda: {(): len(self.__jobs)})
+        IN_FLIGHT.set_function(lambda: {(): len(self.__in_flight)})
+
+    def start(self) -> None:
+        self.__workers = [asyncio.create_task(self.__worker()) for _ in range(self.num_workers)]
+
+    async def stop(self) -> None:
+        """
+        Wait for every queued job to be processed and stop the workers
+        """
+        async with self.__cond:
+            await self.__cond.wait_for(lambda: len(self.__jobs) == 0 and len(self.__in_flight) == 0)
+
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+
+    async def submit(self, job: IngestJob) -> None:
+        async with self.__cond:
+            queued: IngestJob | None = self.__jobs.get(job.path)
+            if queued is not None:
+                # Keep the queue position and age of the first job so busy files aren't starved
+                job.enqueued_at = queued.enqueued_at
+                self.coalesced += 1
+                JOBS.inc(1, ("coalesced",))
+            self.__jobs[job.path] = job
+            self.__cond.notify_all()
+
+    def __has_ready_job(self) -> bool:
+        return any(path not in self.__in_flight for path in self.__jobs)
+
+    def __take_ready_jobs(self) -> List[IngestJob]:
+        ready: List[IngestJob] = []
+        for path in list(self.__jobs.keys()):
+            if len(ready) >= self.max_batch_files:
+                break
+            if path in self.__in_flight:
+                continue
+            ready.append(self.__jobs.pop(path))
+        return ready
+
+    async def __worker(self) -> None:
+        while True:
+            async with self.__cond:
+                await self.__cond.wait_for(self.__has_ready_job)
+                jobs: List[IngestJob] = self.__take_ready_jobs()
+                self.__in_flight.update(job.path for job in jobs)
+            BATCH_FILES.observe(len(jobs))
+
+            failed: bool = False
+            try:
+                await asyncio.to_thread(self.__handler, jobs)
+            except Exception as e:
+                failed = True
+                print(Fore.RED + f"[ERROR]: Couldn't process {len(jobs)} queued jobs: {e}")
+
+            async with self.__cond:
+                self.__in_flight.difference_update(job.path for job in jobs)
+                if failed:
+                    self.failed += len(jobs)
+                    JOBS.inc(len(jobs), ("failed",))
+                else:
+                    self.processed += len(jobs)
+                    JOBS.inc(len(jobs), ("processed",))
+                now: float = time.monotonic()
+                self.last_lag = now - min(job.enqueued_at for job in jobs)
+                for job in jobs:
+                    JOB_LAG_SECONDS.observe(now - job.enqueued_at)
+                self.__cond.notify_all()
+
+    def status(self) -> Dict:
+        now: float = time.monotonic()
+        return {
+            "queue_depth": len(self.__jobs),
+            "in_flight": len(self.__in_flight),
+            "oldest_job_lag_seconds": max((now - job.enqueued_at for job in self.__jobs.values()), default=0.0),
+            "last_job_lag_seconds": self.last_lag,
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "failed": self.failed
+        }
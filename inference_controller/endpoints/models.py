@@ -20,3 +20,13 @@ class TokenizedFile(BaseModel):
 class FilePath(BaseModel):
     path: str
     dir: str
+
+class SearchQuery(BaseModel):
+    token_types: List[str]
+    n: int = 5
+    project: str | None = None
+
+class SearchBatch(BaseModel):
+    queries: List[List[str]]
+    n: int = 5
+    project: str | None = None
@@ -0,0 +1,98 @@
+from typing import Dict, Iterable, List, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from manager.load_config import CONFIG
+from manager.metrics import Counter
+
+LOOKUPS: Counter = Counter("grep_ic_result_cache_lookups_total", "Search result cache lookups by outcome", labels=("result",))
+
+class Generations:
+    """
+    Per-project generation counters, a project's counter is bumped every time an update or delete of one of its files
+    is applied. Unscoped searches use a global counter bumped with every project. Generations are strings made of a
+    random epoch and the counter so generations handed out before a restart never match new ones
+    """
+
+    def __init__(self):
+        self.epoch: str = os.urandom(4).hex()
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__counters: Dict[str, int] = {}
+        self.__global: int = 0
+
+    def bump(self, proj_dirs: Iterable[str]) -> None:
+        with self.__lock:
+            for proj_dir in set(proj_dirs):
+                self.__counters[proj_dir] = self.__counters.get(proj_dir, 0) + 1
+            self.__global += 1
+
+    def get(self, proj_dir: str | None) -> str:
+        with self.__lock:
+            counter: int = self.__global if proj_dir is None else self.__counters.get(proj_dir, 0)
+        return f"{self.epoch}-{counter}"
+
+
+class ResultCache:
+    """
+    LRU of complete search results keyed by query vector, project, n and search params. Entries remember the generation
+    of their project when they were searched and are only returned while it is still current
+    """
+
+    def __init__(self, max_entries: int, search_params: str):
+        self.max_entries: int = max_entries
+        self.search_params: str = search_params
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__entries: OrderedDict[bytes, Tuple[str, List[Dict]]] = OrderedDict()
+
+    def key(self, vector: np.ndarray, project: str | None, n: int) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(np.ascontiguousarray(vector).tobytes())
+        h.update(f"\0{project}\0{n}\0{self.search_params}".encode())
+        return h.digest()
+
+    def get(self, key: bytes, generation: str) -> List[Dict] | None:
+        with self.__lock:
+            entry: Tuple[str, List[Dict]] | None = self.__entries.get(key)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                LOOKUPS.inc(1, ("miss",))
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+        LOOKUPS.inc(1, ("hit",))
+        return entry[1]
+
+    def put(self, key: bytes, generation: str, results: List[Dict]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self.__lock:
+            self.__entries[key] = (generation, results)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self.__lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "entries": len(self.__entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits/lookups if lookups > 0 else 0.0
+            }
+
+
+def result_cache_from_config() -> ResultCache:
+    # Everything besides the query that changes the hits of a search
+    search_params: str = json.dumps([CONFIG["VECTOR_STORE"], CONFIG["INDEX"]["SEARCH_PARAMS"]], sort_keys=True)
+    return ResultCache(CONFIG["RESULT_CACHE"]["MAX_ENTRIES"], search_params)
@@ -1,52 +1,243 @@
-from typing import List
-from pymilvus import Collection
-from sentence_transformers import SentenceTransformer
-import uuid
-
-from endpoints.models import FilePath, TokenizedFile
-from vectordb.transform import vector_function
-
-from colorama import Fore
-
-def __delete_vectorized_file(collection: Collection, path: str):
-    res = collection.delete(expr=f"token_path == \"{path}\"")
-    collection.flush()
-    print(Fore.BLUE + f"[NOTIFIACTION]: Delete result: {res}")
-
-
-def vectorize_file(collection: Collection, model: SentenceTransformer | None, num_inserts_not_indexed: int, tokenized_file: TokenizedFile) -> int:
-    __delete_vectorized_file(collection, tokenized_file.path)
-
-    for line in tokenized_file.lines:
-        if line.code.strip() == "" or len(line.tokens) == 0:
-            continue
-        token_id: str = str(uuid.uuid4())
-        token_vector: List = vector_function([t.token_type for t in line.tokens], model).flatten().tolist()
-        token_code: str = line.code
-        token_path: str = tokenized_file.path
-        token_line: int = line.line
-        token_dir: str = tokenized_file.dir
-
-        new_tokenized_file: List = [
-            [token_id],
-            [token_vector],
-            [token_code],
-            [token_path],
-            [token_line],
-            [token_dir]
+from typing import Dict, List, Set, Tuple
+import hashlib
+import time
+import numpy as np
+
+from endpoints.models import CodeLine, FilePath, TokenizedFile
+from endpoints.ingest_queue import IngestJob
+from endpoints.result_cache import Generations, ResultCache
+from vectordb.transform import vector_function_batch
+from vectordb.vector_store import VectorStore
+from vectordb.flush_policy import FlushPolicy
+from vectordb.micro_batcher import MicroBatcher
+from vectordb.encoders import Encoder
+from vectordb.partitions import LEGACY_PARTITION, PartitionManager
+from vectordb.path_index import PathIndex
+from manager.metrics import Counter, Histogram
+
+
+INGEST_STAGE_SECONDS: Histogram = Histogram("grep_ic_ingest_stage_seconds", "Time spent in each stage of applying a batch of ingest jobs", labels=("stage",))
+SEARCH_STAGE_SECONDS: Histogram = Histogram("grep_ic_search_stage_seconds", "Time spent in each stage of a search", labels=("stage",))
+ROWS: Counter = Counter("grep_ic_rows_total", "Rows written to the vector store", labels=("op",))
+
+def __delete_legacy_rows(store: VectorStore, partitions: PartitionManager, path: str):
+    if partitions.has_legacy_rows:
+        store.delete_path(path, LEGACY_PARTITION)
+
+def __delete_ids(store: VectorStore, removed_ids: Dict[str, List[str]]) -> int:
+    """
+    Delete rows by primary key, the ids of every file in a partition are deleted together
+    """
+    num_deleted: int = 0
+    for partition, token_ids in removed_ids.items():
+        if len(token_ids) > 0:
+            num_deleted += store.delete_ids(token_ids, partition)
+    return num_deleted
+
+def __row_id(path: str, code: str, occurrence: int) -> str:
+    """
+    Deterministic row id of the occurrence-th line with this code in the file, stays the same when the line only moves
+    """
+    return hashlib.sha256(f"{path}\0{code}\0{occurrence}".encode()).hexdigest()
+
+def __group_by_partition(partitions: List[str]) -> Dict[str, List[int]]:
+    groups: Dict[str, List[int]] = {}
+    for i, partition in enumerate(partitions):
+        groups.setdefault(partition, []).append(i)
+    return groups
+
+def __select_rows(rows: List, indices: List[int]) -> List:
+    token_ids, vectors, *columns = rows
+    return [[token_ids[i] for i in indices], vectors[indices], *[[column[i] for i in indices] for column in columns]]
+
+def __rows_bytes(rows: List, vector_bytes: int) -> int:
+    token_ids, _, token_codes, token_paths, token_lines, token_dirs = rows
+    return vector_bytes + sum(len(s) for s in token_ids) + sum(len(s) for s in token_codes) + sum(len(s) for s in token_paths) + sum(len(s) for s in token_dirs) + 8*len(token_lines)
+
+def sync_files(store: VectorStore, partitions: PartitionManager, path_index: PathIndex, model: Encoder | None, batcher: MicroBatcher | None, flush_policy: FlushPolicy, tokenized_files: List[TokenizedFile], deleted_files: List[FilePath]) -> int:
+    """
+    Bring the rows of every updated file up to date with its new contents and remove the rows of every deleted file.
+    Rows are identified by path, code and occurrence so only lines with new content are vectorized and inserted, lines
+    that just moved get their token_line updated and rows whose content disappeared are deleted by primary key in one
+    batch for all the files. Every project's rows go to its own partition. Flushing is left to the flush policy.
+    Returns the number of rows vectorized
+    """
+    token_ids: List[str] = []
+    token_codes: List[str] = []
+    token_paths: List[str] = []
+    token_lines: List[int] = []
+    token_dirs: List[str] = []
+    token_types: List[List[str]] = []
+    token_partitions: List[str] = []
+
+    removed_ids: Dict[str, List[str]] = {}
+    shifted: Dict[str, Tuple[int, str, str, str, str, List[str]]] = {}
+    current_rows: Dict[str, Dict[str, int]] = {}
+
+    for deleted_file in deleted_files:
+        partition: str | None = partitions.get(deleted_file.dir)
+        with INGEST_STAGE_SECONDS.time(("lookup",)):
+            if partition is not None:
+                removed_ids.setdefault(partition, []).extend(path_index.rows(partition, deleted_file.path).keys())
+            path_index.forget(deleted_file.path)
+            __delete_legacy_rows(store, partitions, deleted_file.path)
+
+    for tokenized_file in tokenized_files:
+        partition = partitions.ensure(tokenized_file.dir)
+        with INGEST_STAGE_SECONDS.time(("lookup",)):
+            existing: Dict[str, int] = path_index.rows(partition, tokenized_file.path)
+            __delete_legacy_rows(store, partitions, tokenized_file.path)
+
+        occurrences: Dict[str, int] = {}
+        rows: Dict[str, int] = {}
+        code_lines: List[CodeLine] = [line for line in tokenized_file.lines if line.code.strip() != "" and len(line.tokens) > 0]
+        for line in code_lines:
+            occurrence: int = occurrences.get(line.code, 0)
+            occurrences[line.code] = occurrence + 1
+
+            token_id: str = __row_id(tokenized_file.path, line.code, occurrence)
+            rows[token_id] = line.line
+
+            if token_id in existing:
+                if existing[token_id] != line.line:
+                    shifted[token_id] = (line.line, line.code, tokenized_file.path, tokenized_file.dir, partition, [t.token_type for t in line.tokens])
+                continue
+
+            token_ids.append(token_id)
+            token_codes.append(line.code)
+            token_paths.append(tokenized_file.path)
+            token_lines.append(line.line)
+            token_dirs.append(tokenized_file.dir)
+            token_types.append([t.token_type for t in line.tokens])
+            token_partitions.append(partition)
+
+        removed_ids.setdefault(partition, []).extend(token_id for token_id in existing if token_id not in rows)
+        current_rows[tokenized_file.path] = rows
+
+    with INGEST_STAGE_SECONDS.time(("delete",)):
+        num_deleted: int = __delete_ids(store, removed_ids)
+    ROWS.inc(num_deleted, ("deleted",))
+
+    num_rows: int = 0
+    num_bytes: int = 0
+
+    if len(shifted) > 0:
+        move_start: float = time.perf_counter()
+        # Reuse the stored vectors of lines that only moved instead of vectorizing them again
+        res: List[Dict] = store.query_ids(list(shifted.keys()), ["token_id", "token_vector"])
+        shifted_ids: List[str] = [row["token_id"] for row in res]
+        shifted_rows: List = [
+            shifted_ids,
+            np.stack([row["token_vector"] for row in res]) if len(res) > 0 else np.empty((0, 0)),
+            [shifted[token_id][1] for token_id in shifted_ids],
+            [shifted[token_id][2] for token_id in shifted_ids],
+            [shifted[token_id][0] for token_id in shifted_ids],
+            [shifted[token_id][3] for token_id in shifted_ids]
+        ]
+
+        for partition, indices in __group_by_partition([shifted[token_id][4] for token_id in shifted_ids]).items():
+            store.upsert(__select_rows(shifted_rows, indices), partition)
+        num_rows += len(shifted_ids)
+        num_bytes += __rows_bytes(shifted_rows, shifted_rows[1].nbytes)
+        INGEST_STAGE_SECONDS.observe(time.perf_counter() - move_start, ("move",))
+        ROWS.inc(len(shifted_ids), ("moved",))
+
+        # Rows the path index knows about but the store doesn't have (e.g. after a failed job) are inserted as new rows
+        found_ids: Set[str] = set(shifted_ids)
+        for token_id, (line_number, code, path, proj_dir, partition, types) in shifted.items():
+            if token_id in found_ids:
+                continue
+            token_ids.append(token_id)
+            token_codes.append(code)
+            token_paths.append(path)
+            token_lines.append(line_number)
+            token_dirs.append(proj_dir)
+            token_types.append(types)
+            token_partitions.append(partition)
+
+    if len(token_ids) > 0:
+        with INGEST_STAGE_SECONDS.time(("encode",)):
+            token_vectors: np.ndarray = vector_function_batch(token_types, model, batcher)
+
+        new_rows: List = [
+            token_ids,
+            token_vectors,
+            token_codes,
+            token_paths,
+            token_lines,
+            token_dirs
         ]
 
-        res = collection.insert(new_tokenized_file)
+        with INGEST_STAGE_SECONDS.time(("insert",)):
+            for partition, indices in __group_by_partition(token_partitions).items():
+                store.insert(__select_rows(new_rows, indices), partition)
+        ROWS.inc(len(token_ids), ("inserted",))
+        num_rows += len(token_ids)
+        num_bytes += __rows_bytes(new_rows, token_vectors.nbytes)
+
+    for path, rows in current_rows.items():
+        path_index.set_rows(path, rows)
 
-        print(Fore.BLUE + f"[NOTIFIACTION]: Insert result: {res}")
+    flush_policy.register(num_rows + num_deleted, num_bytes)
+    flush_policy.flush_if_due(store)
 
-        if num_inserts_not_indexed >= 1000:
-            collection.flush()
-            num_inserts_not_indexed = 0
+    return len(token_ids)
+
+def process_jobs(store: VectorStore, partitions: PartitionManager, path_index: PathIndex, model: Encoder | None, batcher: MicroBatcher | None, flush_policy: FlushPolicy, generations: Generations, jobs: List[IngestJob]) -> None:
+    """
+    Apply a group of queued jobs, every job belongs to a different path. The generations of the jobs' projects are
+    bumped afterwards, even when applying failed part way through
+    """
+    tokenized_files: List[TokenizedFile] = []
+    deleted_files: List[FilePath] = []
+    for job in jobs:
+        if job.action == "update":
+            assert(isinstance(job.payload, TokenizedFile))
+            tokenized_files.append(job.payload)
         else:
-            num_inserts_not_indexed += 1
+            assert(isinstance(job.payload, FilePath))
+            deleted_files.append(job.payload)
+
+    try:
+        sync_files(store, partitions, path_index, model, batcher, flush_policy, tokenized_files, deleted_files)
+    except Exception:
+        # The store may hold only part of the jobs' changes, reload the paths' rows from it next time
+        for job in jobs:
+            path_index.forget(job.path)
+        raise
+    finally:
+        generations.bump(job.dir for job in jobs)
+
+def search(store: VectorStore, partitions: PartitionManager, model: Encoder | None, batcher: MicroBatcher | None, result_cache: ResultCache, generations: Generations, queries: List[List[str]], n: int, project: str | None) -> Tuple[List[List[Dict]], str]:
+    """
+    Vectorize every query and run the ones without cached results in one multi-vector search, project searches only
+    look at the project's partition. Returns the hits of each query ordered by distance and the generation they're from
+    """
+    # Read before searching so results that race with an update are cached under the older generation
+    generation: str = generations.get(project)
+    if len(queries) == 0:
+        return [], generation
+
+    partition_names: List[str] | None = None
+    if project is not None:
+        partition: str | None = partitions.get(project)
+        if partition is None:
+            return [[] for _ in queries], generation
+        partition_names = [partition]
+
+    with SEARCH_STAGE_SECONDS.time(("encode",)):
+        search_vectors: np.ndarray = vector_function_batch(queries, model, batcher)
+
+    keys: List[bytes] = [result_cache.key(vector, project, n) for vector in search_vectors]
+    results: List[List[Dict] | None] = [result_cache.get(key, generation) for key in keys]
+    missing: List[int] = [i for i, res in enumerate(results) if res is None]
 
-    return num_inserts_not_indexed
+    if len(missing) > 0:
+        output_fields: List[str] = ["token_code", "token_dir", "token_line", "token_path"]
+        with SEARCH_STAGE_SECONDS.time(("search",)):
+            found: List[List[Dict]] = store.search(search_vectors[missing], n, partition_names, output_fields)
+        for i, hits in zip(missing, found):
+            results[i] = hits
+            result_cache.put(keys[i], generation, hits)
 
-def delete_file(collection: Collection, file_path: FilePath) -> None:
-    __delete_vectorized_file(collection, file_path.path)
+    return [res if res is not None else [] for res in results], generation
@@ -1,48 +1,75 @@
 from manager.load_config import CONFIG
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from contextlib import asynccontextmanager
-
-import pymilvus
+import asyncio
+import time
 
 import colorama 
 from colorama import Fore
 
-from sentence_transformers import SentenceTransformer
-
-from vectordb.setupCollections import setup_collection
+from vectordb.vector_store import VectorStore, vector_store_from_config
+from vectordb.flush_policy import FlushPolicy, flush_policy_from_config
+from vectordb.partitions import PartitionManager
+from vectordb.path_index import PathIndex
+from vectordb.micro_batcher import micro_batcher_from_config
+from vectordb.transform import encode_sentences
+from vectordb.encoders import encoder_from_config
 from endpoints import router as endpoints_router
+from endpoints.ingest_queue import IngestQueue
+from endpoints.result_cache import Generations, result_cache_from_config
+from endpoints.service import process_jobs
+from manager.metrics import Histogram
+
+import functools
 
 colorama.init(autoreset=True)
 
+# Covers body parsing and validation, which happen before the endpoint functions run
+REQUEST_SECONDS: Histogram = Histogram("grep_ic_http_request_seconds", "Time spent handling each request", labels=("method", "route", "status"))
+
+async def flush_periodically(app: FastAPI):
+    flush_policy: FlushPolicy = app.state.flush_policy
+    while True:
+        await asyncio.sleep(flush_policy.max_seconds)
+        # Only hand the flush to a thread when something is pending
+        if flush_policy.is_due():
+            await asyncio.to_thread(flush_policy.flush_if_due, app.state.vector_store)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.milvus_connection = pymilvus.connections.connect(
-        alias="default",
-        host="127.0.0.1",
-        port="19530"
-    )
-
-    app.state.tokens_collection = setup_collection()
+    app.state.vector_store = vector_store_from_config()
+    app.state.partitions = PartitionManager(app.state.vector_store)
+    app.state.path_index = PathIndex(app.state.vector_store, CONFIG["PATH_INDEX"]["MAX_PATHS"])
     
     if CONFIG["VECTOR_FUNCTION"] == "transformers":
-        app.state.transformer_model = SentenceTransformer("all-mpnet-base-v2")
+        app.state.transformer_model = encoder_from_config()
+        app.state.micro_batcher = micro_batcher_from_config(functools.partial(encode_sentences, model=app.state.transformer_model))
     else:
         app.state.transformer_model = None
+        app.state.micro_batcher = None
 
-    app.state.num_inserts_not_indexed = 0
+    app.state.generations = Generations()
+    app.state.result_cache = result_cache_from_config()
 
-    yield
+    app.state.flush_policy = flush_policy_from_config()
+    flush_task: asyncio.Task = asyncio.create_task(flush_periodically(app))
+
+    app.state.ingest_queue = IngestQueue(
+        handler=functools.partial(process_jobs, app.state.vector_store, app.state.partitions, app.state.path_index, app.state.transformer_model, app.state.micro_batcher, app.state.flush_policy, app.state.generations),
+        num_workers=CONFIG["INGEST"]["WORKERS"],
+        max_batch_files=CONFIG["INGEST"]["MAX_BATCH_FILES"]
+    )
+    app.state.ingest_queue.start()
 
-    if not pymilvus.connections.has_connection("default"):
-        return
+    yield
 
-    app.state.tokens_collection.flush()
-    app.state.tokens_collection.release()
+    await app.state.ingest_queue.stop()
+    flush_task.cancel()
 
-    pymilvus.connections.disconnect("default")
+    app.state.vector_store.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -55,4 +82,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start: float = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    # Label by route template rather than the raw path to keep the number of series bounded
+    REQUEST_SECONDS.observe(time.perf_counter() - start, (request.method, route.path if route is not None else "unmatched", str(response.status_code)))
+    return response
+
 app.include_router(endpoints_router)
@@ -0,0 +1,93 @@
+from manager.load_config import CONFIG
+from manager.args import readArguments
+
+from typing import Dict, List
+from pprint import pprint
+
+import colorama
+import yaml
+
+# Typical token type sentences used by the drift check when no corpus is given
+SAMPLE_CORPUS: List[str] = [
+    "IDENTIFIER ASSIGN IDENTIFIER",
+    "RETURN IDENTIFIER",
+    "IDENTIFIER ASSIGN NUMBER",
+    "IDENTIFIER ASSIGN STRING",
+    "IMPORT IDENTIFIER",
+    "FROM IDENTIFIER IMPORT IDENTIFIER COMMA IDENTIFIER",
+    "DEF IDENTIFIER LEFT_PARENTHESIS IDENTIFIER COMMA IDENTIFIER RIGHT_PARENTHESIS COLON",
+    "IF IDENTIFIER EQUALS_EQUALS NUMBER COLON",
+    "FOR IDENTIFIER IN IDENTIFIER LEFT_PARENTHESIS IDENTIFIER RIGHT_PARENTHESIS COLON",
+    "IDENTIFIER DOT IDENTIFIER LEFT_PARENTHESIS IDENTIFIER RIGHT_PARENTHESIS",
+    "PRINT LEFT_PARENTHESIS STRING RIGHT_PARENTHESIS",
+    "TRY COLON",
+    "EXCEPT IDENTIFIER AS IDENTIFIER COLON",
+    "RAISE IDENTIFIER LEFT_PARENTHESIS STRING RIGHT_PARENTHESIS",
+    "WITH IDENTIFIER LEFT_PARENTHESIS IDENTIFIER COMMA STRING RIGHT_PARENTHESIS AS IDENTIFIER COLON",
+    "IDENTIFIER LEFT_SQUARE_BRACKET IDENTIFIER RIGHT_SQUARE_BRACKET ASSIGN IDENTIFIER ADD NUMBER",
+    "RETURN BOOLEAN_TRUE",
+    "ELSE COLON",
+    "WHILE NOT IDENTIFIER COLON",
+    "IDENTIFIER ASSIGN LAMBDA IDENTIFIER COLON IDENTIFIER MULTIPLY NUMBER",
+]
+
+def main():
+    colorama.init(autoreset=True)
+    args = readArguments()
+
+    if args["command"] == "export-onnx":
+        from vectordb.encoders import export_onnx
+        export_onnx()
+
+    elif args["command"] == "drift":
+        from vectordb.encoders import Encoder, load_encoder, drift_report
+        from vectordb.transform import token_sentence
+
+        if args["corpus"] is not None:
+            with open(args["corpus"], "r") as file:
+                corpus: List[str] = [line.strip() for line in file.readlines() if line.strip() != ""]
+        else:
+            corpus: List[str] = SAMPLE_CORPUS
+
+        sentences: List[str] = [token_sentence(line.split()) for line in corpus]
+        reference: Encoder = load_encoder("sentence_transformers")
+        candidates: List[Encoder] = [load_encoder(backend) for backend in args["backends"]]
+
+        report: Dict = drift_report(reference, candidates, sentences, CONFIG["BATCH_SIZE"])
+        pprint(report)
+
+    elif args["command"] == "sweep":
+        import numpy as np
+        from vectordb.index_sweep import DEFAULT_GRID, sample_store_vectors, sweep
+        from vectordb.milvus_store import connect
+        from vectordb.vector_store import vector_store_from_config
+
+        if args["corpus"] is not None:
+            vectors: np.ndarray = np.load(args["corpus"]).astype(np.float32)
+        else:
+            vectors: np.ndarray = sample_store_vectors(vector_store_from_config(), args["sample"] + args["queries"])
+
+        # The sweep builds its indexes in a scratch milvus collection whatever store config.yaml uses
+        connect(CONFIG["VECTOR_STORE"]["MILVUS"]["HOST"], CONFIG["VECTOR_STORE"]["MILVUS"]["PORT"])
+
+        if args["grid"] is not None:
+            with open(args["grid"], "r") as file:
+                grid: List[Dict] = yaml.load(file, Loader=yaml.FullLoader)
+        else:
+            grid: List[Dict] = DEFAULT_GRID
+
+        vectors = vectors[np.random.default_rng(0).permutation(len(vectors))]
+        results: List[Dict] = sweep(vectors[args["queries"]:], vectors[:args["queries"]], args["k"], grid)
+        pprint(results)
+
+    elif args["command"] == "reindex":
+        from vectordb.vector_store import VectorStore, vector_store_from_config
+
+        store: VectorStore = vector_store_from_config()
+        store.rebuild_index()
+        store.close()
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -5,20 +5,71 @@ def readArguments():
     Read all command line arguments
     """
 
-    parser = argparse.ArgumentParser(description="DEFAULT DESCRIPTION")
-    parser.add_argument(
-        "-example",
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Grep++ inference controller maintenance commands")
+    subparsers: argparse.Action = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("export-onnx", help="export the configured model to ONNX along with an int8 quantized copy")
+
+    parser_drift: argparse.ArgumentParser = subparsers.add_parser("drift", help="compare the vectors of the encoder backends on a sample corpus")
+    __build_parser_drift(parser_drift)
+
+    parser_sweep: argparse.ArgumentParser = subparsers.add_parser("sweep", help="measure recall and latency of index configurations against exact search")
+    __build_parser_sweep(parser_sweep)
+
+    subparsers.add_parser("reindex", help="rebuild the index of the vector store with the configuration in config.yaml")
+
+    args = vars(parser.parse_args())
+
+    return args
+
+def __build_parser_drift(parser_drift: argparse.ArgumentParser) -> None:
+    parser_drift.add_argument(
+        "--corpus",
+        "-c",
+        required=False,
+        type=str,
+        help="file with one sentence of token types per line, a small built in sample is used when missing"
+    )
+    parser_drift.add_argument(
+        "--backends",
+        "-b",
+        nargs="+",
+        default=["onnx", "onnx_int8"],
+        help="backends compared against sentence_transformers"
+    )
+
+def __build_parser_sweep(parser_sweep: argparse.ArgumentParser) -> None:
+    parser_sweep.add_argument(
+        "--corpus",
+        "-c",
         required=False,
-        action="store_true",
-        help="Example store true argument"
+        type=str,
+        help=".npy file with a (N, VECTOR_SIZE) float32 matrix, vectors are sampled from the TOKENS collection when missing"
+    )
+    parser_sweep.add_argument(
+        "--sample",
+        "-s",
+        type=int,
+        default=100000,
+        help="number of vectors sampled from the TOKENS collection when no corpus is given"
     )
-    parser.add_argument(
-        "-secondexample",
+    parser_sweep.add_argument(
+        "--queries",
+        "-q",
+        type=int,
+        default=200,
+        help="number of corpus vectors held out and used as queries"
+    )
+    parser_sweep.add_argument(
+        "-k",
+        type=int,
+        default=10,
+        help="number of neighbors used for recall@k"
+    )
+    parser_sweep.add_argument(
+        "--grid",
+        "-g",
         required=False,
         type=str,
-        help="Example string argument"
+        help="yaml file with a list of {INDEX_TYPE, BUILD_PARAMS, SEARCH_PARAMS: [...]} entries, a default grid is used when missing"
     )
-
-    args = parser.parse_args()
-
-    return args
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The metrics registry is shared by the components and lives in common/ at the top of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from common.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram, Metric, power_of_two_buckets, render, start_http_server
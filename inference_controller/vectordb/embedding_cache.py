@@ -0,0 +1,172 @@
+from typing import Dict, List, Tuple
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from manager.load_config import CONFIG
+
+from colorama import Fore
+
+# A full cache file is trimmed down to this share of its limit, so eviction runs once every many writes
+DISK_LOW_WATER: float = 0.9
+
+class EmbeddingCache:
+    """
+    Two tier cache of sentence embeddings, a size bounded in-memory LRU in front of an optional sqlite
+    file so embeddings survive restarts. Keys are hashes of the normalized sentence within a namespace
+    that identifies the model producing the vectors. The file evicts the entries least recently read from
+    or written to it, lookups served by the memory tier don't reach it
+    """
+
+    def __init__(self, namespace: str, memory_entries: int, disk_path: str | None = None, disk_max_entries: int = 0):
+        self.namespace: str = namespace
+        self.memory_entries: int = memory_entries
+        self.disk_max_entries: int = disk_max_entries
+
+        self.hits_memory: int = 0
+        self.hits_disk: int = 0
+        self.misses: int = 0
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.__disk: sqlite3.Connection | None = None
+        # Rows in the cache file, counted once on open then estimated from above by adding every written key
+        self.__disk_entries: int = 0
+
+        if disk_path is not None:
+            self.__disk = self.__open_disk(os.path.expanduser(disk_path))
+
+    def __open_disk(self, disk_path: str) -> sqlite3.Connection | None:
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            conn: sqlite3.Connection = sqlite3.connect(disk_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL DEFAULT 0)")
+            # Caches written before entries tracked their last use
+            if "last_used" not in [column[1] for column in conn.execute("PRAGMA table_info(embeddings)")]:
+                conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            (self.__disk_entries,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        except Exception as e:
+            print(Fore.YELLOW + f"[WARNING]: Couldn't open embedding cache \"{disk_path}\" continuing with memory cache only")
+            print(e)
+            return None
+
+        return conn
+
+    def key(self, sentence: str) -> str:
+        normalized: str = " ".join(sentence.split())
+        return hashlib.blake2b(f"{self.namespace}\0{normalized}".encode(), digest_size=16).hexdigest()
+
+    def get_many(self, sentences: List[str]) -> Tuple[List[np.ndarray | None], List[str]]:
+        """
+        Look up every sentence, returns the cached vectors (None on a miss) together with the keys so
+        the missing vectors can be stored with put_many
+        """
+        keys: List[str] = [self.key(sentence) for sentence in sentences]
+        vectors: List[np.ndarray | None] = [None]*len(keys)
+        disk_lookups: List[int] = []
+
+        with self.__lock:
+            for i, key in enumerate(keys):
+                vector: np.ndarray | None = self.__memory.get(key)
+                if vector is not None:
+                    self.__memory.move_to_end(key)
+                    vectors[i] = vector
+                    self.hits_memory += 1
+                else:
+                    disk_lookups.append(i)
+
+            if self.__disk is not None and len(disk_lookups) > 0:
+                found: Dict[str, np.ndarray] = self.__disk_get([keys[i] for i in disk_lookups])
+                for i in disk_lookups:
+                    vector = found.get(keys[i])
+                    if vector is not None:
+                        vectors[i] = vector
+                        self.hits_disk += 1
+                        self.__memory_put(keys[i], vector)
+
+            self.misses += sum(1 for vector in vectors if vector is None)
+
+        return vectors, keys
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        with self.__lock:
+            for key, vector in zip(keys, vectors):
+                self.__memory_put(key, vector)
+
+            if self.__disk is not None:
+                self.__disk_put(keys, vectors)
+
+    def __memory_put(self, key: str, vector: np.ndarray) -> None:
+        self.__memory[key] = vector
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __disk_get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        assert(self.__disk is not None)
+        found: Dict[str, np.ndarray] = {}
+        # Stay below sqlite's bound parameter limit
+        for i in range(0, len(keys), 500):
+            chunk: List[str] = keys[i:i+500]
+            rows = self.__disk.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?'*len(chunk))})", chunk).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if len(found) > 0:
+            try:
+                now: float = time.time()
+                self.__disk.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self.__disk.commit()
+            except Exception as e:
+                print(Fore.YELLOW + f"[WARNING]: Couldn't write to embedding cache: {e}")
+        return found
+
+    def __disk_put(self, keys: List[str], vectors: np.ndarray) -> None:
+        assert(self.__disk is not None)
+        try:
+            now: float = time.time()
+            self.__disk.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in zip(keys, vectors)]
+            )
+            self.__disk_entries += len(keys)
+            # Replaced keys make the estimate overshoot, the rows are only counted once it passes the limit
+            if self.disk_max_entries > 0 and self.__disk_entries > self.disk_max_entries:
+                (self.__disk_entries,) = self.__disk.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                if self.__disk_entries > self.disk_max_entries:
+                    low_water: int = int(self.disk_max_entries*DISK_LOW_WATER)
+                    self.__disk_entries -= self.__disk.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (self.__disk_entries - low_water,)
+                    ).rowcount
+            self.__disk.commit()
+        except Exception as e:
+            print(Fore.YELLOW + f"[WARNING]: Couldn't write to embedding cache: {e}")
+
+    def stats(self) -> Dict:
+        with self.__lock:
+            lookups: int = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk)/lookups if lookups > 0 else 0.0,
+                "memory_entries": len(self.__memory)
+            }
+
+
+def embedding_cache_from_config() -> EmbeddingCache:
+    return EmbeddingCache(
+        namespace=f"{CONFIG['VECTOR_FUNCTION']}:{CONFIG['MODEL_NAME']}:{CONFIG['ENCODER']['BACKEND']}:{CONFIG['VECTOR_SIZE']}",
+        memory_entries=CONFIG["EMBEDDING_CACHE"]["MEMORY_ENTRIES"],
+        disk_path=CONFIG["EMBEDDING_CACHE"]["DISK_PATH"],
+        disk_max_entries=CONFIG["EMBEDDING_CACHE"]["DISK_MAX_ENTRIES"]
+    )
@@ -0,0 +1,178 @@
+from typing import Dict, List
+import os
+import time
+
+import numpy as np
+
+from manager.load_config import CONFIG, LOCAL
+
+from colorama import Fore
+
+class Encoder:
+    """
+    Sentence encoder backend, turns sentences into a (N, VECTOR_SIZE) float32 matrix of normalized embeddings
+    """
+    name: str = "encoder"
+
+    def encode(self, sentences: List[str], batch_size: int) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerEncoder(Encoder):
+    name: str = "sentence_transformers"
+
+    def __init__(self, model_name: str, num_threads: int = 0):
+        # Lazy imports so the other backends and bagging run without torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        self.model: SentenceTransformer = SentenceTransformer(model_name)
+
+    def encode(self, sentences: List[str], batch_size: int) -> np.ndarray:
+        res = self.model.encode(sentences, batch_size=batch_size, convert_to_numpy=True)
+        assert(isinstance(res, np.ndarray))
+
+        return res.astype(np.float32, copy=False)
+
+
+class OnnxEncoder(Encoder):
+    """
+    Runs an exported copy of the sentence-transformers model with ONNX Runtime on the CPU, mean pooling and
+    normalization are done with numpy the same way the sentence-transformers pipeline does
+    """
+
+    def __init__(self, onnx_path: str, num_threads: int = 0, name: str = "onnx"):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        if not os.path.exists(onnx_path):
+            print(Fore.RED + f"[ERROR]: ONNX model \"{onnx_path}\" doesn't exist, export it with \"python manage.py export-onnx\"")
+            raise FileNotFoundError(onnx_path)
+
+        self.name = name
+
+        options: onnxruntime.SessionOptions = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        self.session: onnxruntime.InferenceSession = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names: List[str] = [node.name for node in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path(onnx_path))
+        self.max_length: int = min(self.tokenizer.model_max_length, CONFIG["ENCODER"]["MAX_SEQ_LENGTH"])
+
+    def encode(self, sentences: List[str], batch_size: int) -> np.ndarray:
+        res: List[np.ndarray] = []
+        for i in range(0, len(sentences), batch_size):
+            encoded = self.tokenizer(sentences[i:i+batch_size], padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+            inputs: Dict[str, np.ndarray] = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings: np.ndarray = self.session.run(None, inputs)[0]
+
+            mask: np.ndarray = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled: np.ndarray = (token_embeddings*mask).sum(axis=1)/np.clip(mask.sum(axis=1), 1e-9, None)
+            res.append(pooled/np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+
+        return np.concatenate(res).astype(np.float32, copy=False)
+
+
+def __model_path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(LOCAL, path)
+
+def tokenizer_path(onnx_path: str) -> str:
+    # The tokenizer is exported next to the ONNX models so they load without the sentence-transformers hub
+    return os.path.join(os.path.dirname(onnx_path), "tokenizer")
+
+def load_encoder(backend: str) -> Encoder:
+    num_threads: int = CONFIG["ENCODER"]["INTRA_OP_THREADS"]
+
+    if backend == "sentence_transformers":
+        return SentenceTransformerEncoder(CONFIG["MODEL_NAME"], num_threads)
+    elif backend == "onnx":
+        return OnnxEncoder(__model_path(CONFIG["ENCODER"]["ONNX_PATH"]), num_threads, name="onnx")
+    elif backend == "onnx_int8":
+        return OnnxEncoder(__model_path(CONFIG["ENCODER"]["ONNX_INT8_PATH"]), num_threads, name="onnx_int8")
+
+    raise ValueError(f"unknown encoder backend \"{backend}\"")
+
+def encoder_from_config() -> Encoder:
+    return load_encoder(CONFIG["ENCODER"]["BACKEND"])
+
+
+def export_onnx() -> None:
+    """
+    Export the configured sentence-transformers model to ONNX and write a dynamically int8 quantized copy next to it
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    onnx_path: str = __model_path(CONFIG["ENCODER"]["ONNX_PATH"])
+    int8_path: str = __model_path(CONFIG["ENCODER"]["ONNX_INT8_PATH"])
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    os.makedirs(os.path.dirname(int8_path), exist_ok=True)
+
+    model: SentenceTransformer = SentenceTransformer(CONFIG["MODEL_NAME"], device="cpu")
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, transformer: torch.nn.Module):
+            super().__init__()
+            self.transformer: torch.nn.Module = transformer
+
+        def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+            return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    sample = model.tokenizer(["identifier assign identifier"], return_tensors="pt")
+    torch.onnx.export(
+        TokenEmbeddings(model[0].auto_model).eval(),
+        (sample["input_ids"], sample["attention_mask"]),
+        onnx_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["token_embeddings"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "token_embeddings": {0: "batch", 1: "sequence"}
+        },
+        opset_version=14
+    )
+    model.tokenizer.save_pretrained(tokenizer_path(onnx_path))
+    if tokenizer_path(int8_path) != tokenizer_path(onnx_path):
+        model.tokenizer.save_pretrained(tokenizer_path(int8_path))
+    print(Fore.GREEN + f"[SUCCESS]: Exported ONNX model to \"{onnx_path}\"")
+
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    print(Fore.GREEN + f"[SUCCESS]: Exported int8 quantized ONNX model to \"{int8_path}\"")
+
+
+def drift_report(reference: Encoder, candidates: List[Encoder], sentences: List[str], batch_size: int) -> Dict:
+    """
+    Encode the sentences with every backend and report the cosine similarity of each candidate's vectors to the
+    reference vectors along with the throughput of every backend
+    """
+    report: Dict = {}
+
+    start: float = time.perf_counter()
+    reference_vectors: np.ndarray = reference.encode(sentences, batch_size)
+    report[reference.name] = {"sentences_per_second": len(sentences)/(time.perf_counter() - start)}
+
+    reference_vectors = reference_vectors/np.clip(np.linalg.norm(reference_vectors, axis=1, keepdims=True), 1e-12, None)
+
+    for candidate in candidates:
+        start = time.perf_counter()
+        candidate_vectors: np.ndarray = candidate.encode(sentences, batch_size)
+        elapsed: float = time.perf_counter() - start
+
+        candidate_vectors = candidate_vectors/np.clip(np.linalg.norm(candidate_vectors, axis=1, keepdims=True), 1e-12, None)
+        cosine: np.ndarray = (reference_vectors*candidate_vectors).sum(axis=1)
+
+        report[candidate.name] = {
+            "sentences_per_second": len(sentences)/elapsed,
+            "cosine_mean": float(cosine.mean()),
+            "cosine_min": float(cosine.min()),
+            "cosine_p01": float(np.percentile(cosine, 1))
+        }
+
+    return report
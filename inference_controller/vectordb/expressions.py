@@ -0,0 +1,15 @@
+from typing import Iterable, List
+import json
+
+def quote(value: str) -> str:
+    """
+    Quote and escape a string so it can be embedded in a milvus boolean expression
+    """
+    return json.dumps(value)
+
+def ids_in(ids: Iterable[str]) -> str:
+    return f"token_id in [{', '.join(quote(token_id) for token_id in ids)}]"
+
+def chunks(values: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(values), size):
+        yield values[i:i+size]
@@ -0,0 +1,83 @@
+from typing import Dict
+import threading
+import time
+
+from vectordb.vector_store import VectorStore
+
+from manager.load_config import CONFIG
+from manager.metrics import Histogram
+
+from colorama import Fore
+
+FLUSH_SECONDS: Histogram = Histogram("grep_ic_flush_seconds", "Time spent flushing the vector store")
+FLUSH_ROWS: Histogram = Histogram("grep_ic_flush_rows", "Rows written since the previous flush at every flush", buckets=(100, 1000, 10000, 100000, 1000000))
+
+class FlushPolicy:
+    """
+    Decide when the vector store should be flushed based on the rows and bytes written since the
+    last flush and the time elapsed since then. Shared between requests so every method is thread safe
+    """
+
+    def __init__(self, max_rows: int, max_bytes: int, max_seconds: float):
+        self.max_rows: int = max_rows
+        self.max_bytes: int = max_bytes
+        self.max_seconds: float = max_seconds
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__pending_rows: int = 0
+        self.__pending_bytes: int = 0
+        self.__last_flush: float = time.monotonic()
+
+    def register(self, rows: int, num_bytes: int) -> None:
+        with self.__lock:
+            self.__pending_rows += rows
+            self.__pending_bytes += num_bytes
+
+    def is_due(self) -> bool:
+        with self.__lock:
+            return self.__is_due()
+
+    def __is_due(self) -> bool:
+        if self.__pending_rows == 0:
+            return False
+
+        return (
+            self.__pending_rows >= self.max_rows
+            or self.__pending_bytes >= self.max_bytes
+            or time.monotonic() - self.__last_flush >= self.max_seconds
+        )
+
+    def flush_if_due(self, store: VectorStore) -> bool:
+        """
+        Flush the store if any of the limits has been reached, returns whether a flush happened
+        """
+        with self.__lock:
+            if not self.__is_due():
+                return False
+            pending: Dict = {"rows": self.__pending_rows, "bytes": self.__pending_bytes}
+            self.__pending_rows = 0
+            self.__pending_bytes = 0
+            self.__last_flush = time.monotonic()
+
+        with FLUSH_SECONDS.time():
+            store.flush()
+        FLUSH_ROWS.observe(pending["rows"])
+        print(Fore.BLUE + f"[NOTIFIACTION]: Flushed vector store with {pending['rows']} pending rows ({pending['bytes']} bytes)")
+
+        return True
+
+    def stats(self) -> Dict:
+        with self.__lock:
+            return {
+                "pending_rows": self.__pending_rows,
+                "pending_bytes": self.__pending_bytes,
+                "seconds_since_flush": time.monotonic() - self.__last_flush
+            }
+
+
+def flush_policy_from_config() -> FlushPolicy:
+    return FlushPolicy(
+        max_rows=CONFIG["FLUSH"]["MAX_ROWS"],
+        max_bytes=CONFIG["FLUSH"]["MAX_BYTES"],
+        max_seconds=CONFIG["FLUSH"]["MAX_SECONDS"]
+    )
@@ -0,0 +1,117 @@
+from typing import Dict, List
+import time
+
+import numpy as np
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+
+from manager.load_config import CONFIG
+from vectordb.vector_store import VectorStore
+
+from colorama import Fore
+
+SWEEP_COLLECTION: str = "TOKENS_SWEEP"
+
+# Used when no grid file is given, every entry is built once and searched with each of its search params
+DEFAULT_GRID: List[Dict] = [
+    {"INDEX_TYPE": "IVF_FLAT", "BUILD_PARAMS": {"nlist": 1024}, "SEARCH_PARAMS": [{"nprobe": 8}, {"nprobe": 32}, {"nprobe": 128}]},
+    {"INDEX_TYPE": "IVF_SQ8", "BUILD_PARAMS": {"nlist": 1024}, "SEARCH_PARAMS": [{"nprobe": 8}, {"nprobe": 32}, {"nprobe": 128}]},
+    {"INDEX_TYPE": "IVF_PQ", "BUILD_PARAMS": {"nlist": 1024, "m": 48, "nbits": 8}, "SEARCH_PARAMS": [{"nprobe": 8}, {"nprobe": 32}, {"nprobe": 128}]},
+    {"INDEX_TYPE": "HNSW", "BUILD_PARAMS": {"M": 16, "efConstruction": 200}, "SEARCH_PARAMS": [{"ef": 32}, {"ef": 64}, {"ef": 256}]},
+    {"INDEX_TYPE": "DISKANN", "BUILD_PARAMS": {}, "SEARCH_PARAMS": [{"search_list": 32}, {"search_list": 100}]},
+]
+
+def sample_store_vectors(store: VectorStore, num_vectors: int) -> np.ndarray:
+    """
+    Pull up to num_vectors vectors out of the vector store to sweep on real data
+    """
+    vectors: List = []
+    for page in store.iterate(["token_vector"], 1000):
+        vectors.extend(row["token_vector"] for row in page)
+        if len(vectors) >= num_vectors:
+            break
+
+    return np.asarray(vectors[:num_vectors], dtype=np.float32)
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Brute force L2 nearest neighbors, returns the (num_queries, k) corpus indices used as ground truth
+    """
+    corpus_norms: np.ndarray = (corpus*corpus).sum(axis=1)
+    neighbors: List[np.ndarray] = []
+    # Chunk the queries so the distance matrix stays small
+    for i in range(0, len(queries), 256):
+        chunk: np.ndarray = queries[i:i+256]
+        distances: np.ndarray = corpus_norms[None, :] - 2*chunk@corpus.T
+        top: np.ndarray = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order: np.ndarray = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+        neighbors.append(np.take_along_axis(top, order, axis=1))
+    return np.concatenate(neighbors)
+
+def __build_sweep_collection(corpus: np.ndarray, index_params: Dict) -> Collection:
+    if utility.has_collection(SWEEP_COLLECTION):
+        utility.drop_collection(SWEEP_COLLECTION)
+
+    schema: CollectionSchema = CollectionSchema(fields=[
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=corpus.shape[1])
+    ])
+    col: Collection = Collection(name=SWEEP_COLLECTION, schema=schema)
+
+    for i in range(0, len(corpus), 10000):
+        col.insert([list(range(i, min(i + 10000, len(corpus)))), corpus[i:i+10000].tolist()])
+    col.flush()
+
+    col.create_index(field_name="vector", index_params=index_params)
+    col.load()
+
+    return col
+
+def sweep(corpus: np.ndarray, queries: np.ndarray, k: int, grid: List[Dict]) -> List[Dict]:
+    """
+    Build every index of the grid on the corpus in a scratch collection and measure recall@k against exact
+    search along with single query latency percentiles for each of its search params
+    """
+    if CONFIG["VECTOR_TYPE"] != "float_vector":
+        raise ValueError("index sweeps are only supported for float vectors")
+
+    truth: np.ndarray = exact_neighbors(corpus, queries, k)
+    results: List[Dict] = []
+
+    for entry in grid:
+        index_params: Dict = {"metric_type": "L2", "index_type": entry["INDEX_TYPE"], "params": entry["BUILD_PARAMS"]}
+        print(Fore.BLUE + f"[NOTIFIACTION]: Building {entry['INDEX_TYPE']} {entry['BUILD_PARAMS']} on {len(corpus)} vectors")
+
+        start: float = time.perf_counter()
+        try:
+            col: Collection = __build_sweep_collection(corpus, index_params)
+        except Exception as e:
+            print(Fore.RED + f"[ERROR]: Couldn't build {entry['INDEX_TYPE']} index: {e}")
+            continue
+        build_seconds: float = time.perf_counter() - start
+
+        for search_params in entry["SEARCH_PARAMS"]:
+            latencies: List[float] = []
+            recalls: List[float] = []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                res = col.search(data=[query.tolist()], anns_field="vector", param={"metric_type": "L2", "params": search_params}, limit=k)
+                latencies.append(time.perf_counter() - start)
+
+                found: List[int] = [hit.id for hit in res[0]] #type: ignore
+                recalls.append(len(set(found) & set(expected.tolist()))/k)
+
+            results.append({
+                "index_type": entry["INDEX_TYPE"],
+                "build_params": entry["BUILD_PARAMS"],
+                "search_params": search_params,
+                "build_seconds": build_seconds,
+                f"recall@{k}": float(np.mean(recalls)),
+                "p50_ms": float(np.percentile(latencies, 50))*1000,
+                "p99_ms": float(np.percentile(latencies, 99))*1000
+            })
+            print(Fore.GREEN + f"[SUCCESS]: {results[-1]}")
+
+        col.release()
+        utility.drop_collection(SWEEP_COLLECTION)
+
+    return results
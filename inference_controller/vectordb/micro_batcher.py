@@ -0,0 +1,107 @@
+from typing import Callable, Dict, List, Tuple
+from concurrent.futures import Future
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from manager.load_config import CONFIG
+from manager.metrics import Histogram, power_of_two_buckets
+
+BATCH_SENTENCES: Histogram = Histogram("grep_ic_micro_batch_sentences", "Sentences encoded together in every micro batch", buckets=power_of_two_buckets(4096))
+BATCH_WAIT_SECONDS: Histogram = Histogram("grep_ic_micro_batch_wait_seconds", "Time requests wait in the micro batcher before their batch is encoded", buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+class MicroBatcher:
+    """
+    Collect sentences from concurrent callers and encode them together. A batch is sent to the model once it
+    holds max_batch_size sentences or its oldest request has waited max_wait_ms
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size: int = max_batch_size
+        self.max_wait: float = max_wait_ms/1000
+
+        self.__encode: Callable[[List[str]], np.ndarray] = encode
+        self.__cond: threading.Condition = threading.Condition()
+        self.__pending: List[Tuple[List[str], Future, float]] = []
+        self.__pending_sentences: int = 0
+
+        self.__thread: threading.Thread = threading.Thread(target=self.__run, name="micro-batcher", daemon=True)
+        self.__thread.start()
+
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        """
+        Encode the sentences as part of the next batch, blocks until their vectors are ready
+        """
+        future: Future = Future()
+        with self.__cond:
+            self.__pending.append((sentences, future, time.monotonic()))
+            self.__pending_sentences += len(sentences)
+            self.__cond.notify()
+
+        return future.result()
+
+    def __take_batch(self) -> List[Tuple[List[str], Future, float]]:
+        with self.__cond:
+            self.__cond.wait_for(lambda: len(self.__pending) > 0)
+
+            deadline: float = self.__pending[0][2] + self.max_wait
+            while self.__pending_sentences < self.max_batch_size and time.monotonic() < deadline:
+                self.__cond.wait(deadline - time.monotonic())
+
+            # Always take at least one request so oversized requests still go through on their own
+            batch: List[Tuple[List[str], Future, float]] = [self.__pending.pop(0)]
+            size: int = len(batch[0][0])
+            while len(self.__pending) > 0 and size + len(self.__pending[0][0]) <= self.max_batch_size:
+                size += len(self.__pending[0][0])
+                batch.append(self.__pending.pop(0))
+
+            self.__pending_sentences -= size
+
+        return batch
+
+    def __run(self) -> None:
+        while True:
+            batch: List[Tuple[List[str], Future, float]] = self.__take_batch()
+            sentences: List[str] = [sentence for request, _, _ in batch for sentence in request]
+            now: float = time.monotonic()
+            for _, _, arrival in batch:
+                BATCH_WAIT_SECONDS.observe(now - arrival)
+
+            try:
+                vectors: np.ndarray = self.__encode(sentences)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            BATCH_SENTENCES.observe(len(sentences))
+
+            start: int = 0
+            for request, future, _ in batch:
+                future.set_result(vectors[start:start+len(request)])
+                start += len(request)
+
+    def stats(self) -> Dict:
+        counts: List[int]
+        sentences: float
+        counts, sentences = BATCH_SENTENCES.snapshot()
+        with self.__cond:
+            pending_sentences: int = self.__pending_sentences
+        # Buckets count the batches up to their bound like Prometheus' le buckets
+        cumulative: List[int] = list(itertools.accumulate(counts))
+        return {
+            "batches": sum(counts),
+            "sentences": int(sentences),
+            "pending_sentences": pending_sentences,
+            "batch_size_histogram": {f"le_{int(bucket)}": count for bucket, count in zip(BATCH_SENTENCES.buckets, cumulative)} | {"le_inf": cumulative[-1]}
+        }
+
+
+def micro_batcher_from_config(encode: Callable[[List[str]], np.ndarray]) -> MicroBatcher:
+    return MicroBatcher(
+        encode=encode,
+        max_batch_size=CONFIG["MICRO_BATCH"]["MAX_BATCH_SIZE"],
+        max_wait_ms=CONFIG["MICRO_BATCH"]["MAX_WAIT_MS"]
+    )
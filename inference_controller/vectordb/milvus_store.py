@@ -0,0 +1,138 @@
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pymilvus
+from pymilvus import Collection
+
+from manager.load_config import CONFIG
+from vectordb.vector_store import VectorStore
+from vectordb.expressions import quote, ids_in, chunks
+from vectordb.setupCollections import rebuild_index, search_params_from_config
+from vectordb.transform import to_milvus_vectors
+
+from colorama import Fore
+
+# Ids per delete or query expression, keeps the expressions well below milvus' size limits
+IDS_CHUNK_SIZE: int = 4096
+
+def connect(host: str, port: str) -> None:
+    pymilvus.connections.connect(
+        alias="default",
+        host=host,
+        port=port
+    )
+
+def __from_milvus_vector(vector) -> np.ndarray:
+    if CONFIG["VECTOR_TYPE"] == "binary_vector":
+        # Binary vectors come back as a list holding the packed bytes
+        return np.frombuffer(vector[0] if isinstance(vector, list) else vector, dtype=np.uint8)
+    return np.asarray(vector, dtype=np.float32)
+
+def from_milvus_rows(rows: List[Dict]) -> List[Dict]:
+    for row in rows:
+        if "token_vector" in row:
+            row["token_vector"] = __from_milvus_vector(row["token_vector"])
+    return rows
+
+
+class MilvusStore(VectorStore):
+    """
+    Rows kept in the TOKENS collection of a milvus service, every partition of the store is a collection partition
+    """
+    name: str = "milvus"
+
+    def __init__(self, collection: Collection):
+        self.collection: Collection = collection
+
+    def partition_names(self) -> List[str]:
+        return [partition.name for partition in self.collection.partitions]
+
+    def has_partition(self, partition: str) -> bool:
+        return self.collection.has_partition(partition)
+
+    def create_partition(self, partition: str, description: str = "") -> None:
+        self.collection.create_partition(partition, description=description)
+
+    def num_entities(self, partition: str) -> int:
+        return self.collection.partition(partition).num_entities
+
+    def __milvus_rows(self, rows: List) -> List:
+        return [rows[0], to_milvus_vectors(rows[1]), *rows[2:]]
+
+    def insert(self, rows: List, partition: str) -> None:
+        res = self.collection.insert(self.__milvus_rows(rows), partition_name=partition)
+        print(Fore.BLUE + f"[NOTIFIACTION]: Insert result: {res}")
+
+    def upsert(self, rows: List, partition: str) -> None:
+        res = self.collection.upsert(self.__milvus_rows(rows), partition_name=partition)
+        print(Fore.BLUE + f"[NOTIFIACTION]: Upsert result: {res}")
+
+    def delete_ids(self, token_ids: List[str], partition: str) -> int:
+        for chunk in chunks(token_ids, IDS_CHUNK_SIZE):
+            res = self.collection.delete(expr=ids_in(chunk), partition_name=partition)
+            print(Fore.BLUE + f"[NOTIFIACTION]: Delete result: {res}")
+        return len(token_ids)
+
+    def delete_path(self, path: str, partition: str) -> None:
+        self.collection.delete(expr=f"token_path == {quote(path)}", partition_name=partition)
+
+    def query_path(self, path: str, partition: str, output_fields: List[str]) -> List[Dict]:
+        return from_milvus_rows(self.collection.query(
+            expr=f"token_path == {quote(path)}",
+            output_fields=output_fields,
+            partition_names=[partition],
+            consistency_level="Strong"
+        ))
+
+    def query_ids(self, token_ids: List[str], output_fields: List[str]) -> List[Dict]:
+        res: List[Dict] = []
+        for chunk in chunks(token_ids, IDS_CHUNK_SIZE):
+            res.extend(self.collection.query(
+                expr=ids_in(chunk),
+                output_fields=output_fields,
+                consistency_level="Strong"
+            ))
+        return from_milvus_rows(res)
+
+    def iterate(self, output_fields: List[str], batch_size: int, partition_names: List[str] | None = None) -> Iterator[List[Dict]]:
+        iterator = self.collection.query_iterator(batch_size=batch_size, output_fields=output_fields, partition_names=partition_names)
+        try:
+            while True:
+                page: List[Dict] = iterator.next()
+                if len(page) == 0:
+                    break
+                yield from_milvus_rows(page)
+        finally:
+            iterator.close()
+
+    def search(self, vectors: np.ndarray, limit: int, partition_names: List[str] | None, output_fields: List[str]) -> List[List[Dict]]:
+        # Session consistency sees every write of this process, results are cached until the next write of their project
+        res = self.collection.search(
+            data=to_milvus_vectors(vectors),
+            anns_field="token_vector",
+            param=search_params_from_config(),
+            limit=limit,
+            output_fields=output_fields,
+            partition_names=partition_names,
+            consistency_level="Session"
+        )
+
+        results: List[List[Dict]] = []
+        for hits in res: #type: ignore
+            results.append([{"distance": hit.distance, **{field: hit.entity.get(field) for field in output_fields}} for hit in hits])
+        return results
+
+    def rebuild_index(self) -> None:
+        rebuild_index(self.collection)
+
+    def flush(self) -> None:
+        self.collection.flush()
+
+    def close(self) -> None:
+        if not pymilvus.connections.has_connection("default"):
+            return
+
+        self.collection.flush()
+        self.collection.release()
+
+        pymilvus.connections.disconnect("default")
@@ -0,0 +1,425 @@
+from typing import Dict, Iterator, List, Tuple
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from vectordb.vector_store import VectorStore
+from vectordb.partitions import LEGACY_PARTITION
+from vectordb.expressions import chunks
+
+from colorama import Fore
+
+METADATA_FIELDS: List[str] = ["token_id", "token_code", "token_path", "token_line", "token_dir"]
+
+# Rows scored at once during a search, bounds the memory of the distance matrices
+SEARCH_CHUNK_ROWS: int = 65536
+# Stay below sqlite's bound parameter limit
+SQL_CHUNK_SIZE: int = 500
+# Vectors sampled per cluster to train the IVF centroids
+IVF_TRAINING_ROWS_PER_LIST: int = 256
+# An IVF index is trained automatically once the store holds this many rows per cluster
+IVF_MIN_ROWS_PER_LIST: int = 39
+IVF_ITERATIONS: int = 10
+
+POPCOUNT: np.ndarray = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+def squared_l2(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """
+    (num_queries, num_vectors) squared L2 distances, the same distance milvus reports for L2
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    distances: np.ndarray = (queries*queries).sum(axis=1)[:, None] - 2*queries@vectors.T + (vectors*vectors).sum(axis=1)[None, :]
+    # Rounding can leave identical vectors slightly below zero
+    return np.maximum(distances, 0)
+
+def hamming(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """
+    (num_queries, num_vectors) hamming distances between packed binary vectors
+    """
+    return np.stack([POPCOUNT[np.bitwise_xor(vectors, query)].sum(axis=1) for query in queries]).astype(np.float32)
+
+def merge_top_k(best_distances: np.ndarray, best_slots: np.ndarray, distances: np.ndarray, slots: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge a chunk of (num_queries, num_rows) distances of the rows slots into the running top k of every query
+    """
+    all_distances: np.ndarray = np.concatenate([best_distances, distances], axis=1)
+    all_slots: np.ndarray = np.concatenate([best_slots, np.broadcast_to(slots, distances.shape)], axis=1)
+    if all_distances.shape[1] > k:
+        top: np.ndarray = np.argpartition(all_distances, k - 1, axis=1)[:, :k]
+        all_distances = np.take_along_axis(all_distances, top, axis=1)
+        all_slots = np.take_along_axis(all_slots, top, axis=1)
+    return all_distances, all_slots
+
+def kmeans(vectors: np.ndarray, num_clusters: int, iterations: int) -> np.ndarray:
+    rng: np.random.Generator = np.random.default_rng(0)
+    centroids: np.ndarray = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments: np.ndarray = squared_l2(vectors, centroids).argmin(axis=1)
+        for cluster in range(num_clusters):
+            members: np.ndarray = vectors[assignments == cluster]
+            # Empty clusters keep their centroid
+            if len(members) > 0:
+                centroids[cluster] = members.mean(axis=0)
+    return centroids
+
+
+class NumpyStore(VectorStore):
+    """
+    Embedded store for machines without a milvus service. Vectors live in a memory-mapped matrix indexed by
+    slot and the other columns in a sqlite table, searches are exact or go through a k-means IVF index
+    (float vectors only). Writes are committed to sqlite right away, the vectors file and IVF index on flush
+    """
+    name: str = "numpy"
+
+    def __init__(self, path: str, vector_type: str, vector_size: int, index_type: str = "FLAT", nlist: int = 256, nprobe: int = 16):
+        self.path: str = os.path.expanduser(path)
+        self.binary: bool = vector_type == "binary_vector"
+        self.dtype: type = np.uint8 if self.binary else np.float32
+        self.width: int = vector_size//8 if self.binary else vector_size
+        self.index_type: str = index_type
+        self.nlist: int = nlist
+        self.nprobe: int = nprobe
+
+        if self.binary and index_type == "IVF":
+            print(Fore.YELLOW + "[WARNING]: The numpy store only builds IVF indexes for float vectors, searching binary vectors exactly")
+            self.index_type = "FLAT"
+
+        os.makedirs(self.path, exist_ok=True)
+        self.__lock: threading.RLock = threading.RLock()
+        self.__db: sqlite3.Connection = self.__open_metadata(vector_type, vector_size)
+        self.__partitions: Dict[str, int] = {name: partition_id for partition_id, name in self.__db.execute("SELECT id, name FROM partitions")}
+
+        self.__vectors_path: str = os.path.join(self.path, "vectors.u8" if self.binary else "vectors.f32")
+        self.__row_bytes: int = self.width*np.dtype(self.dtype).itemsize
+        if not os.path.exists(self.__vectors_path):
+            with open(self.__vectors_path, "wb") as file:
+                file.truncate(1024*self.__row_bytes)
+        self.__vectors: np.memmap = self.__map_vectors()
+        capacity: int = len(self.__vectors)
+
+        # Partition id of every slot, -1 for free slots
+        self.__partition_of: np.ndarray = np.full(capacity, -1, dtype=np.int32)
+        for slot, partition_id in self.__db.execute("SELECT slot, partition_id FROM rows"):
+            self.__partition_of[slot] = partition_id
+        self.__free: List[int] = np.flatnonzero(self.__partition_of < 0)[::-1].tolist()
+
+        # IVF cluster of every slot, -1 for slots added while no index was trained
+        self.__ivf_path: str = os.path.join(self.path, "ivf.npz")
+        self.__centroids: np.ndarray | None = None
+        self.__assignments: np.ndarray = np.full(capacity, -1, dtype=np.int32)
+        self.__load_ivf()
+
+    def __open_metadata(self, vector_type: str, vector_size: int) -> sqlite3.Connection:
+        db: sqlite3.Connection = sqlite3.connect(os.path.join(self.path, "metadata.sqlite"), check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS partitions (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, description TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS rows (slot INTEGER PRIMARY KEY, token_id TEXT UNIQUE NOT NULL, partition_id INTEGER NOT NULL, token_code TEXT, token_path TEXT, token_line INTEGER, token_dir TEXT)")
+        db.execute("CREATE INDEX IF NOT EXISTS rows_path ON rows (partition_id, token_path)")
+        db.execute("INSERT OR IGNORE INTO partitions (name, description) VALUES (?, ?)", (LEGACY_PARTITION, ""))
+
+        layout: str = f"{vector_type}:{vector_size}"
+        db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('layout', ?)", (layout,))
+        stored_layout: str = db.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()[0]
+        db.commit()
+        if stored_layout != layout:
+            print(Fore.RED + f"[ERROR]: Vector store \"{self.path}\" holds {stored_layout} vectors but config.yaml uses {layout}, point PATH somewhere else or delete it to reindex")
+            raise ValueError(f"vector store layout {stored_layout} doesn't match {layout}")
+
+        return db
+
+    def __map_vectors(self) -> np.memmap:
+        capacity: int = os.path.getsize(self.__vectors_path)//self.__row_bytes
+        return np.memmap(self.__vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.width))
+
+    def __load_ivf(self) -> None:
+        if not os.path.exists(self.__ivf_path):
+            return
+        if self.index_type != "IVF":
+            # Searches from other processes use the index file whenever it exists
+            os.remove(self.__ivf_path)
+            return
+        with np.load(self.__ivf_path) as ivf:
+            if ivf["centroids"].shape != (self.nlist, self.width):
+                print(Fore.YELLOW + "[WARNING]: IVF index of the vector store doesn't match config.yaml, it is retrained on the next flush")
+                return
+            self.__centroids = ivf["centroids"]
+            assignments: np.ndarray = ivf["assignments"]
+        count: int = min(len(assignments), len(self.__assignments))
+        self.__assignments[:count] = assignments[:count]
+        self.__assignments[self.__partition_of < 0] = -1
+
+    def __save_ivf(self) -> None:
+        if self.__centroids is None:
+            return
+        tmp_path: str = self.__ivf_path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.__centroids, assignments=self.__assignments)
+        os.replace(tmp_path, self.__ivf_path)
+
+    def __grow(self, min_capacity: int) -> None:
+        capacity: int = max(2*len(self.__vectors), min_capacity)
+        self.__vectors.flush()
+        del self.__vectors
+        with open(self.__vectors_path, "r+b") as file:
+            file.truncate(capacity*self.__row_bytes)
+        self.__vectors = self.__map_vectors()
+
+        added: int = capacity - len(self.__partition_of)
+        self.__free = list(range(capacity - 1, len(self.__partition_of) - 1, -1)) + self.__free
+        self.__partition_of = np.concatenate([self.__partition_of, np.full(added, -1, dtype=np.int32)])
+        self.__assignments = np.concatenate([self.__assignments, np.full(added, -1, dtype=np.int32)])
+
+    def __allocate(self, count: int) -> List[int]:
+        if len(self.__free) < count:
+            self.__grow(len(self.__partition_of) + count - len(self.__free))
+        slots: List[int] = self.__free[-count:][::-1] if count > 0 else []
+        del self.__free[len(self.__free) - count:]
+        return slots
+
+    def __partition_id(self, partition: str) -> int:
+        partition_id: int | None = self.__partitions.get(partition)
+        if partition_id is None:
+            raise KeyError(f"partition \"{partition}\" doesn't exist")
+        return partition_id
+
+    def __release(self, slots: List[int]) -> None:
+        self.__partition_of[slots] = -1
+        self.__assignments[slots] = -1
+        self.__free.extend(slots)
+
+    def __assign(self, slots: List[int], vectors: np.ndarray) -> None:
+        if self.__centroids is not None and len(slots) > 0:
+            self.__assignments[slots] = squared_l2(np.asarray(vectors, dtype=np.float32), self.__centroids).argmin(axis=1)
+
+    def partition_names(self) -> List[str]:
+        with self.__lock:
+            return list(self.__partitions.keys())
+
+    def has_partition(self, partition: str) -> bool:
+        with self.__lock:
+            return partition in self.__partitions
+
+    def create_partition(self, partition: str, description: str = "") -> None:
+        with self.__lock:
+            cursor: sqlite3.Cursor = self.__db.execute("INSERT INTO partitions (name, description) VALUES (?, ?)", (partition, description))
+            self.__db.commit()
+            assert(cursor.lastrowid is not None)
+            self.__partitions[partition] = cursor.lastrowid
+
+    def num_entities(self, partition: str) -> int:
+        with self.__lock:
+            return int((self.__partition_of == self.__partition_id(partition)).sum())
+
+    def __existing_slots(self, token_ids: List[str]) -> Dict[str, int]:
+        existing: Dict[str, int] = {}
+        for chunk in chunks(token_ids, SQL_CHUNK_SIZE):
+            existing.update(self.__db.execute(f"SELECT token_id, slot FROM rows WHERE token_id IN ({','.join('?'*len(chunk))})", chunk).fetchall())
+        return existing
+
+    def upsert(self, rows: List, partition: str) -> None:
+        """
+        Write rows, rows whose id already exists are overwritten in place
+        """
+        token_ids, vectors, token_codes, token_paths, token_lines, token_dirs = rows
+        with self.__lock:
+            partition_id: int = self.__partition_id(partition)
+            existing: Dict[str, int] = self.__existing_slots(token_ids)
+            new_slots: List[int] = self.__allocate(sum(1 for token_id in token_ids if token_id not in existing))
+            new_slots.reverse()
+            slots: List[int] = [existing[token_id] if token_id in existing else new_slots.pop() for token_id in token_ids]
+
+            self.__vectors[slots] = vectors
+            self.__partition_of[slots] = partition_id
+            self.__assign(slots, vectors)
+
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO rows (slot, token_id, partition_id, token_code, token_path, token_line, token_dir) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                zip(slots, token_ids, [partition_id]*len(slots), token_codes, token_paths, [int(line) for line in token_lines], token_dirs)
+            )
+            self.__db.commit()
+
+    def insert(self, rows: List, partition: str) -> None:
+        self.upsert(rows, partition)
+
+    def __delete_where(self, where: str, params: List) -> int:
+        slots: List[int] = [slot for slot, in self.__db.execute(f"SELECT slot FROM rows WHERE {where}", params)]
+        self.__db.execute(f"DELETE FROM rows WHERE {where}", params)
+        self.__release(slots)
+        return len(slots)
+
+    def delete_ids(self, token_ids: List[str], partition: str) -> int:
+        with self.__lock:
+            partition_id: int | None = self.__partitions.get(partition)
+            if partition_id is None:
+                return 0
+            for chunk in chunks(token_ids, SQL_CHUNK_SIZE):
+                self.__delete_where(f"partition_id = ? AND token_id IN ({','.join('?'*len(chunk))})", [partition_id, *chunk])
+            self.__db.commit()
+        return len(token_ids)
+
+    def delete_path(self, path: str, partition: str) -> None:
+        with self.__lock:
+            partition_id: int | None = self.__partitions.get(partition)
+            if partition_id is None:
+                return
+            self.__delete_where("partition_id = ? AND token_path = ?", [partition_id, path])
+            self.__db.commit()
+
+    def __rows(self, where: str, params: List, output_fields: List[str], extra: str = "") -> List[Dict]:
+        columns: List[str] = [field for field in output_fields if field in METADATA_FIELDS]
+        res: List[Dict] = []
+        for row in self.__db.execute(f"SELECT slot, {', '.join(['token_id'] + columns)} FROM rows WHERE {where} {extra}", params):
+            entity: Dict = dict(zip(columns, row[2:]))
+            if "token_id" in output_fields:
+                entity["token_id"] = row[1]
+            if "token_vector" in output_fields:
+                entity["token_vector"] = np.array(self.__vectors[row[0]])
+            entity["slot"] = row[0]
+            res.append(entity)
+        return res
+
+    def __strip_slots(self, rows: List[Dict]) -> List[Dict]:
+        for row in rows:
+            del row["slot"]
+        return rows
+
+    def query_path(self, path: str, partition: str, output_fields: List[str]) -> List[Dict]:
+        with self.__lock:
+            partition_id: int | None = self.__partitions.get(partition)
+            if partition_id is None:
+                return []
+            return self.__strip_slots(self.__rows("partition_id = ? AND token_path = ?", [partition_id, path], output_fields))
+
+    def query_ids(self, token_ids: List[str], output_fields: List[str]) -> List[Dict]:
+        res: List[Dict] = []
+        with self.__lock:
+            for chunk in chunks(token_ids, SQL_CHUNK_SIZE):
+                res.extend(self.__rows(f"token_id IN ({','.join('?'*len(chunk))})", chunk, output_fields))
+        return self.__strip_slots(res)
+
+    def iterate(self, output_fields: List[str], batch_size: int, partition_names: List[str] | None = None) -> Iterator[List[Dict]]:
+        last_slot: int = -1
+        while True:
+            with self.__lock:
+                where: str = "slot > ?"
+                params: List = [last_slot]
+                if partition_names is not None:
+                    partition_ids: List[int] = [self.__partitions[name] for name in partition_names if name in self.__partitions]
+                    where += f" AND partition_id IN ({','.join('?'*len(partition_ids))})"
+                    params.extend(partition_ids)
+                page: List[Dict] = self.__rows(where, params + [batch_size], output_fields, "ORDER BY slot LIMIT ?")
+            if len(page) == 0:
+                return
+            last_slot = page[-1]["slot"]
+            yield self.__strip_slots(page)
+
+    def __distances(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        return hamming(queries, vectors) if self.binary else squared_l2(queries, vectors)
+
+    def __search_slots(self, queries: np.ndarray, limit: int, allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        best_distances: np.ndarray = np.empty((len(queries), 0), dtype=np.float32)
+        best_slots: np.ndarray = np.empty((len(queries), 0), dtype=np.int64)
+
+        if self.__centroids is None:
+            # Exact search, scan the matrix in contiguous chunks
+            for start in range(0, len(allowed), SEARCH_CHUNK_ROWS):
+                slots: np.ndarray = np.flatnonzero(allowed[start:start+SEARCH_CHUNK_ROWS]) + start
+                if len(slots) == 0:
+                    continue
+                end: int = int(slots[-1]) + 1
+                distances: np.ndarray = self.__distances(queries, self.__vectors[start:end])[:, slots - start]
+                best_distances, best_slots = merge_top_k(best_distances, best_slots, distances, slots, limit)
+            return best_distances, best_slots
+
+        # IVF search, score the rows of the nprobe closest clusters of every query and the rows not assigned yet
+        probes: np.ndarray = np.argpartition(squared_l2(queries, self.__centroids), min(self.nprobe, self.nlist) - 1, axis=1)[:, :self.nprobe]
+        results: List[Tuple[np.ndarray, np.ndarray]] = []
+        for query, query_probes in zip(queries, probes):
+            # The extra last entry is looked up by the -1 assignments of unassigned rows
+            probed: np.ndarray = np.zeros(self.nlist + 1, dtype=bool)
+            probed[query_probes] = True
+            probed[-1] = True
+            candidates: np.ndarray = np.flatnonzero(allowed & probed[self.__assignments])
+            query_distances: np.ndarray = np.empty((1, 0), dtype=np.float32)
+            query_slots: np.ndarray = np.empty((1, 0), dtype=np.int64)
+            for start in range(0, len(candidates), SEARCH_CHUNK_ROWS):
+                slots: np.ndarray = candidates[start:start+SEARCH_CHUNK_ROWS]
+                query_distances, query_slots = merge_top_k(query_distances, query_slots, self.__distances(query[None, :], self.__vectors[slots]), slots, limit)
+            results.append((query_distances, query_slots))
+
+        width: int = max(distances.shape[1] for distances, _ in results)
+        best_distances = np.full((len(queries), width), np.inf, dtype=np.float32)
+        best_slots = np.full((len(queries), width), -1, dtype=np.int64)
+        for i, (distances, slots) in enumerate(results):
+            best_distances[i, :distances.shape[1]] = distances[0]
+            best_slots[i, :slots.shape[1]] = slots[0]
+        return best_distances, best_slots
+
+    def search(self, vectors: np.ndarray, limit: int, partition_names: List[str] | None, output_fields: List[str]) -> List[List[Dict]]:
+        queries: np.ndarray = np.asarray(vectors, dtype=self.dtype).reshape(len(vectors), self.width)
+        if not self.binary:
+            queries = queries.astype(np.float32)
+
+        with self.__lock:
+            if partition_names is None:
+                allowed: np.ndarray = self.__partition_of >= 0
+            else:
+                allowed = np.isin(self.__partition_of, [self.__partitions[name] for name in partition_names if name in self.__partitions])
+
+            best_distances: np.ndarray
+            best_slots: np.ndarray
+            best_distances, best_slots = self.__search_slots(queries, limit, allowed)
+
+            found: List[int] = sorted({int(slot) for slot in best_slots.flatten() if slot >= 0})
+            entities: Dict[int, Dict] = {}
+            for chunk in chunks(found, SQL_CHUNK_SIZE):
+                for entity in self.__rows(f"slot IN ({','.join('?'*len(chunk))})", chunk, output_fields):
+                    entities[entity.pop("slot")] = entity
+
+        results: List[List[Dict]] = []
+        for distances, slots in zip(best_distances, best_slots):
+            order: np.ndarray = np.argsort(distances, kind="stable")
+            results.append([{"distance": float(distances[i]), **entities[int(slots[i])]} for i in order if int(slots[i]) in entities])
+        return results
+
+    def rebuild_index(self) -> None:
+        """
+        Train the IVF centroids on a sample of the stored vectors and assign every row to its cluster
+        """
+        if self.index_type != "IVF":
+            print(Fore.BLUE + "[NOTIFIACTION]: The numpy store searches exactly with INDEX_TYPE FLAT, there is no index to rebuild")
+            return
+
+        with self.__lock:
+            alive: np.ndarray = np.flatnonzero(self.__partition_of >= 0)
+            if len(alive) < self.nlist:
+                print(Fore.YELLOW + f"[WARNING]: Need at least {self.nlist} rows to train an IVF index, the store holds {len(alive)}")
+                return
+
+            print(Fore.BLUE + f"[NOTIFIACTION]: Training IVF index with {self.nlist} lists on {len(alive)} rows")
+            rng: np.random.Generator = np.random.default_rng(0)
+            sample: np.ndarray = np.sort(rng.choice(alive, min(len(alive), self.nlist*IVF_TRAINING_ROWS_PER_LIST), replace=False))
+            self.__centroids = kmeans(np.asarray(self.__vectors[sample], dtype=np.float32), self.nlist, IVF_ITERATIONS)
+
+            self.__assignments[:] = -1
+            for start in range(0, len(alive), SEARCH_CHUNK_ROWS):
+                slots: np.ndarray = alive[start:start+SEARCH_CHUNK_ROWS]
+                self.__assign(slots.tolist(), self.__vectors[slots])
+            self.__save_ivf()
+
+        print(Fore.GREEN + "[SUCCESS]: Trained IVF index of the vector store")
+
+    def flush(self) -> None:
+        with self.__lock:
+            self.__vectors.flush()
+            if self.index_type == "IVF" and self.__centroids is None and int((self.__partition_of >= 0).sum()) >= self.nlist*IVF_MIN_ROWS_PER_LIST:
+                self.rebuild_index()
+            self.__save_ivf()
+
+    def close(self) -> None:
+        with self.__lock:
+            self.flush()
+            self.__db.close()
@@ -0,0 +1,49 @@
+from typing import Set
+import hashlib
+import threading
+
+from vectordb.vector_store import VectorStore
+
+from colorama import Fore
+
+LEGACY_PARTITION: str = "_default"
+
+def partition_name(proj_dir: str) -> str:
+    """
+    Name of the partition holding a project's rows, partition names only allow letters, digits and underscores
+    """
+    return "dir_" + hashlib.sha1(proj_dir.encode()).hexdigest()
+
+
+class PartitionManager:
+    """
+    Keep track of the per-project partitions of the vector store, creating them on the first update of a project
+    """
+
+    def __init__(self, store: VectorStore):
+        self.store: VectorStore = store
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__known: Set[str] = set(store.partition_names())
+
+        # Rows indexed before projects had their own partitions live in the default partition
+        self.has_legacy_rows: bool = store.has_partition(LEGACY_PARTITION) and store.num_entities(LEGACY_PARTITION) > 0
+        if self.has_legacy_rows:
+            print(Fore.YELLOW + "[WARNING]: Found rows indexed before per-project partitions, they are cleaned up as their files are updated but won't show up in project searches until then")
+
+    def ensure(self, proj_dir: str) -> str:
+        name: str = partition_name(proj_dir)
+        with self.__lock:
+            if name not in self.__known:
+                if not self.store.has_partition(name):
+                    self.store.create_partition(name, description=proj_dir)
+                    print(Fore.BLUE + f"[NOTIFIACTION]: Created partition \"{name}\" for project \"{proj_dir}\"")
+                self.__known.add(name)
+        return name
+
+    def get(self, proj_dir: str) -> str | None:
+        name: str = partition_name(proj_dir)
+        with self.__lock:
+            if name in self.__known:
+                return name
+        return None
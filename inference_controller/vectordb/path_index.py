@@ -0,0 +1,46 @@
+from typing import Dict, List
+from collections import OrderedDict
+import threading
+
+from vectordb.vector_store import VectorStore
+
+class PathIndex:
+    """
+    Side table of the row ids (and their lines) owned by every path so updates and deletes don't have to look them
+    up in the vector store. Paths are loaded from the store the first time they are needed and the least recently used
+    paths are dropped past max_paths
+    """
+
+    def __init__(self, store: VectorStore, max_paths: int):
+        self.store: VectorStore = store
+        self.max_paths: int = max_paths
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__rows: OrderedDict[str, Dict[str, int]] = OrderedDict()
+
+    def rows(self, partition: str, path: str) -> Dict[str, int]:
+        """
+        Row id to line of every row of the path
+        """
+        with self.__lock:
+            rows: Dict[str, int] | None = self.__rows.get(path)
+            if rows is not None:
+                self.__rows.move_to_end(path)
+                return dict(rows)
+
+        res: List[Dict] = self.store.query_path(path, partition, ["token_id", "token_line"])
+        rows = {row["token_id"]: row["token_line"] for row in res}
+        self.set_rows(path, rows)
+
+        return dict(rows)
+
+    def set_rows(self, path: str, rows: Dict[str, int]) -> None:
+        with self.__lock:
+            self.__rows[path] = rows
+            self.__rows.move_to_end(path)
+            while len(self.__rows) > self.max_paths:
+                self.__rows.popitem(last=False)
+
+    def forget(self, path: str) -> None:
+        with self.__lock:
+            self.__rows.pop(path, None)
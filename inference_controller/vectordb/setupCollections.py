@@ -5,13 +5,62 @@ from pymilvus import Collection, utility
 
 from vectordb.models import schema
 
-def setup_collection() -> Collection:
-    index_params: Dict = {
-        "metric_type": "L2" if CONFIG["VECTOR_TYPE"] == "float_vector" else "HAMMING",
-        "index_type": "IVF_SQ8" if CONFIG["VECTOR_TYPE"] == "float_vector" else "BIN_IVF_FLAT",
-        "params":{"nlist": 1024}
+from colorama import Fore
+
+def metric_type() -> str:
+    return "L2" if CONFIG["VECTOR_TYPE"] == "float_vector" else "HAMMING"
+
+def index_params_from_config() -> Dict:
+    index_type: str = CONFIG["INDEX"]["INDEX_TYPE"]
+    build_params: Dict = dict(CONFIG["INDEX"]["BUILD_PARAMS"] or {})
+
+    # Binary vectors only support the BIN_* indexes
+    if CONFIG["VECTOR_TYPE"] == "binary_vector" and not index_type.startswith("BIN_"):
+        index_type = "BIN_IVF_FLAT"
+        build_params = {"nlist": build_params.get("nlist", 1024)}
+
+    return {
+        "metric_type": metric_type(),
+        "index_type": index_type,
+        "params": build_params
     }
 
+def search_params_from_config() -> Dict:
+    return {"metric_type": metric_type(), "params": dict(CONFIG["INDEX"]["SEARCH_PARAMS"] or {})}
+
+def __flatten_index_params(params: Dict) -> Dict[str, str]:
+    # Depending on the milvus version the build params come back nested under "params" or flattened with string values
+    flat: Dict[str, str] = {}
+    for key, value in params.items():
+        if key == "params" and isinstance(value, dict):
+            flat.update({k: str(v) for k, v in value.items()})
+        else:
+            flat[key] = str(value)
+    return flat
+
+def index_matches_config(col: Collection) -> bool:
+    if not col.has_index():
+        return False
+    return __flatten_index_params(col.index().params) == __flatten_index_params(index_params_from_config())
+
+def rebuild_index(col: Collection) -> None:
+    """
+    Replace the vector index of the collection with the one described in config.yaml
+    """
+    index_params: Dict = index_params_from_config()
+    print(Fore.BLUE + f"[NOTIFIACTION]: Rebuilding index of collection \"{col.name}\" with {index_params}")
+
+    col.release()
+    if col.has_index():
+        col.drop_index()
+    col.create_index(field_name="token_vector", index_params=index_params)
+    col.load()
+
+    print(Fore.GREEN + f"[SUCCESS]: Rebuilt index of collection \"{col.name}\"")
+
+def setup_collection() -> Collection:
+    index_params: Dict = index_params_from_config()
+
     if not utility.has_collection("TOKENS"):
         col = Collection(
             name="TOKENS",
@@ -22,6 +71,12 @@ def setup_collection() -> Collection:
     else:
         col = Collection("TOKENS")
 
+        if not index_matches_config(col):
+            if CONFIG["INDEX"]["REBUILD_ON_CHANGE"]:
+                rebuild_index(col)
+            else:
+                print(Fore.YELLOW + "[WARNING]: Index of collection \"TOKENS\" differs from config.yaml, run \"python manage.py reindex\" to rebuild it")
+
     col.load()
 
     return col
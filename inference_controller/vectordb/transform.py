@@ -1,23 +1,148 @@
-from typing import List
-from sentence_transformers import SentenceTransformer
+from typing import Dict, List
 from manager.load_config import CONFIG
-from torch import Tensor
+from manager.metrics import Counter, Gauge, Histogram, power_of_two_buckets
 import numpy as np
+import threading
+import zlib
 
-def __transform(sentence: str, model: SentenceTransformer) -> np.ndarray:
-    res: List[Tensor] | np.ndarray | Tensor = model.encode(sentence, convert_to_numpy=True)
-    assert(isinstance(res, np.ndarray))
+from vectordb.encoders import Encoder
+from vectordb.embedding_cache import EmbeddingCache, embedding_cache_from_config
+from vectordb.micro_batcher import MicroBatcher
 
-    return res
+# Opened on the first transformer lookup, bagging vectors and the manage.py commands never need it
+__embedding_cache: EmbeddingCache | None = None
+__embedding_cache_lock: threading.Lock = threading.Lock()
 
-def __bagging(tokens: List[str]) -> np.ndarray:
-    return np.zeros([768])
+def embedding_cache() -> EmbeddingCache:
+    global __embedding_cache
+    with __embedding_cache_lock:
+        if __embedding_cache is None:
+            __embedding_cache = embedding_cache_from_config()
+        return __embedding_cache
 
+def embedding_cache_stats() -> Dict | None:
+    """
+    Stats of the embedding cache, None while it hasn't been opened
+    """
+    return __embedding_cache.stats() if __embedding_cache is not None else None
+
+def __cache_lookups() -> Dict:
+    stats: Dict | None = embedding_cache_stats()
+    if stats is None:
+        return {}
+    return {("memory_hit",): stats["hits_memory"], ("disk_hit",): stats["hits_disk"], ("miss",): stats["misses"]}
+
+CACHE_LOOKUPS: Counter = Counter("grep_ic_embedding_cache_lookups_total", "Embedding cache lookups by where the vector was found", labels=("result",))
+CACHE_LOOKUPS.set_function(__cache_lookups)
+CACHE_HIT_RATIO: Gauge = Gauge("grep_ic_embedding_cache_hit_ratio", "Share of embedding cache lookups served from the cache since startup")
+CACHE_HIT_RATIO.set_function(lambda: {(): (embedding_cache_stats() or {"hit_rate": 0.0})["hit_rate"]})
+MODEL_SECONDS: Histogram = Histogram("grep_ic_model_encode_seconds", "Time the model takes to encode a batch of sentences", labels=("backend",))
+MODEL_BATCH_SENTENCES: Histogram = Histogram("grep_ic_model_encode_sentences", "Sentences sent to the model in every call", buckets=power_of_two_buckets(4096))
+
+def encode_sentences(sentences: List[str], model: Encoder) -> np.ndarray:
+    MODEL_BATCH_SENTENCES.observe(len(sentences))
+    with MODEL_SECONDS.time((CONFIG["ENCODER"]["BACKEND"],)):
+        return model.encode(sentences, CONFIG["BATCH_SIZE"]).reshape(len(sentences), -1)
+
+def __cached_transform_batch(sentences: List[str], model: Encoder, batcher: MicroBatcher | None) -> np.ndarray:
+    cached: List[np.ndarray | None]
+    keys: List[str]
+    cache: EmbeddingCache = embedding_cache()
+    cached, keys = cache.get_many(sentences)
+
+    # Identical sentences are very common so only encode each missing one once
+    missing: Dict[str, int] = {}
+    for sentence, vector in zip(sentences, cached):
+        if vector is None and sentence not in missing:
+            missing[sentence] = len(missing)
+
+    if len(missing) > 0:
+        if batcher is not None:
+            missing_vectors: np.ndarray = batcher.encode(list(missing.keys()))
+        else:
+            missing_vectors: np.ndarray = encode_sentences(list(missing.keys()), model)
+        missing_keys: List[str] = [""]*len(missing)
+        for sentence, key, vector in zip(sentences, keys, cached):
+            if vector is None:
+                missing_keys[missing[sentence]] = key
+        cache.put_many(missing_keys, missing_vectors)
+
+        cached = [vector if vector is not None else missing_vectors[missing[sentence]] for sentence, vector in zip(sentences, cached)]
+
+    return np.stack(cached)
+
+__token_type_ids: Dict[str, int] = {}
+
+def __token_type_id(token_type: str) -> int:
+    token_type_id: int | None = __token_type_ids.get(token_type)
+    if token_type_id is None:
+        # crc32 is stable across processes unlike hash() so vectors stay comparable between runs
+        token_type_id = zlib.crc32(token_type.encode()) + 1
+        __token_type_ids[token_type] = token_type_id
+    return token_type_id
+
+def __mix(h: np.ndarray) -> np.ndarray:
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xff51afd7ed558ccd)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xc4ceb9fe1a85ec53)
+    return h ^ (h >> np.uint64(33))
+
+def __bagging_batch(tokens_batch: List[List[str]]) -> np.ndarray:
+    """
+    Bag of hashed token type n-grams, every n-gram of up to BAGGING_NGRAM tokens within a line sets one of VECTOR_SIZE bits.
+    All lines are hashed together with numpy, binary vectors are returned packed 8 bits per byte
+    """
+    vector_size: int = CONFIG["VECTOR_SIZE"]
+    lengths: np.ndarray = np.array([len(tokens) for tokens in tokens_batch], dtype=np.int64)
+    ids: np.ndarray = np.array([__token_type_id(tok) for tokens in tokens_batch for tok in tokens], dtype=np.uint64)
+    line_of: np.ndarray = np.repeat(np.arange(len(tokens_batch)), lengths)
+
+    bits: np.ndarray = np.zeros([len(tokens_batch), vector_size], dtype=bool)
+    with np.errstate(over="ignore"):
+        for n in range(1, CONFIG["BAGGING_NGRAM"] + 1):
+            num_grams: int = len(ids) - n + 1
+            if num_grams <= 0:
+                break
+
+            # Only keep n-grams whose first and last token are on the same line
+            valid: np.ndarray = line_of[:num_grams] == line_of[n-1:]
+            h: np.ndarray = np.full(num_grams, n, dtype=np.uint64)
+            for k in range(n):
+                h = __mix(h*np.uint64(0x100000001b3) + ids[k:k+num_grams])
+
+            bits[line_of[:num_grams][valid], (h[valid] % np.uint64(vector_size)).astype(np.int64)] = True
+
+    if CONFIG["VECTOR_TYPE"] == "binary_vector":
+        return np.packbits(bits, axis=1)
+    return bits.astype(np.float32)
+
+def to_milvus_vectors(vectors: np.ndarray) -> List:
+    """
+    Convert a matrix of vectors into the column format pymilvus expects for the configured vector type
+    """
+    if CONFIG["VECTOR_TYPE"] == "binary_vector":
+        return [row.tobytes() for row in vectors]
+    return vectors.tolist()
+
+def token_sentence(tokens: List[str]) -> str:
+    return " ".join([tok.replace("_", " ").lower() for tok in tokens])
+
+
+def vector_function(tokens: List[str], model: Encoder | None = None, batcher: MicroBatcher | None = None) -> np.ndarray:
+    return vector_function_batch([tokens], model, batcher)[0]
+
+def vector_function_batch(tokens_batch: List[List[str]], model: Encoder | None = None, batcher: MicroBatcher | None = None) -> np.ndarray:
+    """
+    Vectorize many token lists at once, returns a (N, VECTOR_SIZE) matrix with one row per token list.
+    When a batcher is given the sentences missing from the cache are encoded together with those of concurrent callers
+    """
+    if len(tokens_batch) == 0:
+        return np.zeros([0, CONFIG["VECTOR_SIZE"] if CONFIG["VECTOR_TYPE"] == "float_vector" else CONFIG["VECTOR_SIZE"]//8])
 
-def vector_function(tokens: List[str], model: SentenceTransformer | None = None) -> np.ndarray:
     if CONFIG["VECTOR_FUNCTION"] == "transformers":
         if model is None:
-            raise ValueError("model passed in is not a valid SentenceTransformer")
-        return __transform(" ".join([tok.replace("_", " ").lower() for tok in tokens]), model)
+            raise ValueError("model passed in is not a valid Encoder")
+        return __cached_transform_batch([token_sentence(tokens) for tokens in tokens_batch], model, batcher)
     else:
-        return __bagging(tokens)
+        return __bagging_batch(tokens_batch)
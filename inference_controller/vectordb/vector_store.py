@@ -0,0 +1,101 @@
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from manager.load_config import CONFIG
+
+# Columns of the rows given to insert and upsert, in this order
+FIELDS: List[str] = ["token_id", "token_vector", "token_code", "token_path", "token_line", "token_dir"]
+
+class VectorStore:
+    """
+    Storage of the token rows and their vectors, rows are grouped in partitions (one per project). Vectors are
+    float32 (N, VECTOR_SIZE) matrices, binary vectors are packed into uint8 (N, VECTOR_SIZE/8) matrices
+    """
+    name: str = "store"
+
+    def partition_names(self) -> List[str]:
+        raise NotImplementedError
+
+    def has_partition(self, partition: str) -> bool:
+        raise NotImplementedError
+
+    def create_partition(self, partition: str, description: str = "") -> None:
+        raise NotImplementedError
+
+    def num_entities(self, partition: str) -> int:
+        raise NotImplementedError
+
+    def insert(self, rows: List, partition: str) -> None:
+        """
+        Add rows, given as one list per column of FIELDS with the vectors as a matrix
+        """
+        raise NotImplementedError
+
+    def upsert(self, rows: List, partition: str) -> None:
+        raise NotImplementedError
+
+    def delete_ids(self, token_ids: List[str], partition: str) -> int:
+        """
+        Delete the rows with these primary keys, returns the number of ids deleted
+        """
+        raise NotImplementedError
+
+    def delete_path(self, path: str, partition: str) -> None:
+        raise NotImplementedError
+
+    def query_path(self, path: str, partition: str, output_fields: List[str]) -> List[Dict]:
+        raise NotImplementedError
+
+    def query_ids(self, token_ids: List[str], output_fields: List[str]) -> List[Dict]:
+        """
+        Rows with these primary keys in any partition, token_vector is returned as a numpy array
+        """
+        raise NotImplementedError
+
+    def iterate(self, output_fields: List[str], batch_size: int, partition_names: List[str] | None = None) -> Iterator[List[Dict]]:
+        """
+        Every row page by page, pages hold up to batch_size rows
+        """
+        raise NotImplementedError
+
+    def search(self, vectors: np.ndarray, limit: int, partition_names: List[str] | None, output_fields: List[str]) -> List[List[Dict]]:
+        """
+        Nearest rows of every vector ordered by distance, each hit has its "distance" and output fields
+        """
+        raise NotImplementedError
+
+    def rebuild_index(self) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+def vector_store_from_config() -> VectorStore:
+    backend: str = CONFIG["VECTOR_STORE"]["BACKEND"]
+
+    # Lazy imports so the numpy store runs without pymilvus
+    if backend == "milvus":
+        from vectordb.milvus_store import MilvusStore, connect
+        from vectordb.setupCollections import setup_collection
+
+        connect(CONFIG["VECTOR_STORE"]["MILVUS"]["HOST"], CONFIG["VECTOR_STORE"]["MILVUS"]["PORT"])
+        return MilvusStore(setup_collection())
+
+    if backend == "numpy":
+        from vectordb.numpy_store import NumpyStore
+
+        return NumpyStore(
+            path=CONFIG["VECTOR_STORE"]["NUMPY"]["PATH"],
+            vector_type=CONFIG["VECTOR_TYPE"],
+            vector_size=CONFIG["VECTOR_SIZE"],
+            index_type=CONFIG["VECTOR_STORE"]["NUMPY"]["INDEX_TYPE"],
+            nlist=CONFIG["VECTOR_STORE"]["NUMPY"]["NLIST"],
+            nprobe=CONFIG["VECTOR_STORE"]["NUMPY"]["NPROBE"]
+        )
+
+    raise ValueError(f"unknown vector store backend \"{backend}\"")
@@ -0,0 +1,84 @@
+from typing import Callable, Dict, List, Tuple
+import threading
+import time
+
+from colorama import Fore
+
+from manager.metrics import Counter
+
+COALESCED: Counter = Counter("grep_vc_events_coalesced_total", "File system events merged into an action already waiting for the same path")
+ACTIONS: Counter = Counter("grep_vc_debounced_actions_total", "Actions applied after debouncing", labels=("action",))
+
+class Debouncer:
+    """
+    Merge bursts of file system events of a path into one final action ("update" or "delete", the last one wins).
+    An action is applied once no new event arrived for its path during window seconds, or max_delay seconds after
+    its first event for paths that never settle. Due actions are handed to the handler together on a timer thread
+    """
+
+    def __init__(self, handler: Callable[[List[Tuple[str, str]]], None], window: float, max_delay: float):
+        self.window: float = window
+        self.max_delay: float = max_delay
+
+        self.__handler: Callable[[List[Tuple[str, str]]], None] = handler
+        # path -> [action, first event time, deadline]
+        self.__pending: Dict[str, List] = {}
+        self.__cond: threading.Condition = threading.Condition()
+        self.__stopped: bool = False
+        self.__thread: threading.Thread = threading.Thread(target=self.__run, name="debouncer", daemon=True)
+        self.__thread.start()
+
+    def submit(self, path: str, action: str) -> None:
+        now: float = time.monotonic()
+        with self.__cond:
+            entry: List | None = self.__pending.get(path)
+            if entry is None:
+                self.__pending[path] = [action, now, now + self.window]
+            else:
+                COALESCED.inc()
+                entry[0] = action
+                entry[2] = min(now + self.window, entry[1] + self.max_delay)
+            self.__cond.notify()
+
+    def pending(self) -> int:
+        with self.__cond:
+            return len(self.__pending)
+
+    def __take_due(self) -> List[Tuple[str, str]] | None:
+        """
+        Wait for actions to be due, returns None once stopped with nothing left
+        """
+        with self.__cond:
+            while True:
+                if self.__stopped and len(self.__pending) == 0:
+                    return None
+
+                now: float = time.monotonic()
+                due: List[str] = [path for path, entry in self.__pending.items() if self.__stopped or entry[2] <= now]
+                if len(due) > 0:
+                    return [(path, self.__pending.pop(path)[0]) for path in due]
+
+                timeout: float | None = min(entry[2] for entry in self.__pending.values()) - now if len(self.__pending) > 0 else None
+                self.__cond.wait(timeout)
+
+    def __run(self) -> None:
+        while True:
+            actions: List[Tuple[str, str]] | None = self.__take_due()
+            if actions is None:
+                return
+
+            for _, action in actions:
+                ACTIONS.inc(1, (action,))
+            try:
+                self.__handler(actions)
+            except Exception as e:
+                print(Fore.RED + f"[ERROR]: Couldn't apply {len(actions)} file changes: {e}")
+
+    def stop(self) -> None:
+        """
+        Apply every waiting action right away and stop the timer thread
+        """
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify()
+        self.__thread.join()
@@ -0,0 +1,140 @@
+from typing import Dict, Iterable, List, Tuple
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+
+from colorama import Fore
+
+# Stay below sqlite's bound parameter limit
+SQL_CHUNK_SIZE: int = 500
+
+OBJECT_COLUMNS: List[str] = ["path", "size", "mtime_ns", "inode", "checked_ns", "xxhash", "sha256"]
+
+class ObjectStore:
+    """
+    Objects of the project's files kept in one sqlite file: stat, content hashes and the tokens last sent to the
+    inference controller. tokens is NULL while a changed file hasn't been sent yet, so a file whose update was lost
+    to a crash is sent again by the next startup scan. Every write is its own transaction
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__db: sqlite3.Connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                checked_ns INTEGER,
+                xxhash TEXT NOT NULL,
+                sha256 TEXT,
+                tokens BLOB
+            )
+        """)
+        self.__db.execute("CREATE TEMP TABLE present (path TEXT PRIMARY KEY)")
+
+    def __object(self, row: tuple) -> Dict:
+        obj: Dict = {column: value for column, value in zip(OBJECT_COLUMNS, row) if value is not None}
+        obj["sent"] = bool(row[len(OBJECT_COLUMNS)])
+        return obj
+
+    def get(self, path: str) -> Dict | None:
+        with self.__lock:
+            row: tuple | None = self.__db.execute(f"SELECT {', '.join(OBJECT_COLUMNS)}, tokens IS NOT NULL FROM objects WHERE path = ?", [path]).fetchone()
+        return self.__object(row) if row is not None else None
+
+    def get_many(self, paths: List[str]) -> Dict[str, Dict]:
+        found: Dict[str, Dict] = {}
+        with self.__lock:
+            for start in range(0, len(paths), SQL_CHUNK_SIZE):
+                chunk: List[str] = paths[start:start+SQL_CHUNK_SIZE]
+                for row in self.__db.execute(f"SELECT {', '.join(OBJECT_COLUMNS)}, tokens IS NOT NULL FROM objects WHERE path IN ({','.join('?'*len(chunk))})", chunk):
+                    found[row[0]] = self.__object(row)
+        return found
+
+    def put_many(self, objects: Iterable[Dict], changed: bool) -> None:
+        """
+        Store the objects, changed clears their tokens until the new contents are sent
+        """
+        rows: List[List] = [[obj.get(column) for column in OBJECT_COLUMNS] + [changed] for obj in objects]
+        with self.__lock:
+            self.__db.execute("BEGIN IMMEDIATE")
+            self.__db.executemany(f"""
+                INSERT INTO objects ({', '.join(OBJECT_COLUMNS)}) VALUES ({', '.join('?'*len(OBJECT_COLUMNS))})
+                ON CONFLICT (path) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in OBJECT_COLUMNS[1:])},
+                    tokens = CASE WHEN ? THEN NULL ELSE tokens END
+            """, rows)
+            self.__db.execute("COMMIT")
+
+    def put_tokens(self, tokens: Dict[str, Tuple[str, bytes]]) -> None:
+        """
+        Store the tokens sent for each path, given with the content hash they were made from. Tokens of contents that
+        changed again meanwhile are dropped
+        """
+        with self.__lock:
+            self.__db.execute("BEGIN IMMEDIATE")
+            self.__db.executemany("UPDATE objects SET tokens = ? WHERE path = ? AND xxhash = ?", [(snapshot, path, xxhash) for path, (xxhash, snapshot) in tokens.items()])
+            self.__db.execute("COMMIT")
+
+    def delete(self, path: str) -> bool:
+        with self.__lock:
+            return self.__db.execute("DELETE FROM objects WHERE path = ?", [path]).rowcount > 0
+
+    def delete_missing(self, paths: List[str]) -> List[str]:
+        """
+        Remove the objects of every file not in paths, returns their paths
+        """
+        with self.__lock:
+            self.__db.execute("BEGIN IMMEDIATE")
+            self.__db.executemany("INSERT OR IGNORE INTO present (path) VALUES (?)", [(path,) for path in paths])
+            orphaned: List[str] = [path for (path,) in self.__db.execute("SELECT path FROM objects WHERE path NOT IN (SELECT path FROM present)")]
+            self.__db.execute("DELETE FROM objects WHERE path NOT IN (SELECT path FROM present)")
+            self.__db.execute("DELETE FROM present")
+            self.__db.execute("COMMIT")
+        return orphaned
+
+    def import_objects(self, objects: Iterable[Dict]) -> None:
+        """
+        Store objects whose contents were already sent, tokens of the last send are unknown and stay empty
+        """
+        rows: List[List] = [[obj.get(column) for column in OBJECT_COLUMNS] for obj in objects]
+        with self.__lock:
+            self.__db.execute("BEGIN IMMEDIATE")
+            self.__db.executemany(f"INSERT OR REPLACE INTO objects ({', '.join(OBJECT_COLUMNS)}, tokens) VALUES ({', '.join('?'*len(OBJECT_COLUMNS))}, x'')", rows)
+            self.__db.execute("COMMIT")
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__db.close()
+
+
+def migrate_object_cache(store: ObjectStore, cache_dir: str) -> None:
+    """
+    Move the objects of the pickle and index.json object cache into the store and remove the old cache
+    """
+    if not os.path.exists(cache_dir):
+        return
+
+    print(Fore.BLUE + f"[NOTIFICATION]: Moving the object cache \"{cache_dir}\" into \"{store.path}\"")
+    objects: List[Dict] = []
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for name in filenames:
+            if name == "index.json":
+                continue
+            try:
+                with open(os.path.join(dirpath, name), "rb") as file:
+                    obj: Dict = pickle.load(file)
+                objects.append(obj)
+            except Exception as _:
+                print(Fore.YELLOW + f"[WARNING]: Object file \"{os.path.join(dirpath, name)}\" couldn't be loaded, its file will be retokenized if it's still in the project")
+
+    store.import_objects(objects)
+    shutil.rmtree(cache_dir)
+    print(Fore.GREEN + f"[SUCCESS]: Moved {len(objects)} objects into the object store")
@@ -0,0 +1,81 @@
+from typing import Any, Callable, List
+import queue
+import threading
+import zlib
+
+from colorama import Fore
+
+from manager.metrics import Gauge, Histogram
+
+QUEUE_DEPTH: Gauge = Gauge("grep_vc_pipeline_queue_depth", "Items waiting in the queues of each pipeline stage", labels=("stage",))
+STAGE_SECONDS: Histogram = Histogram("grep_vc_pipeline_stage_seconds", "Time spent handling an item in each pipeline stage", labels=("stage",))
+
+# Stages registered for the queue depth gauge
+STAGES: List["Stage"] = []
+QUEUE_DEPTH.set_function(lambda: {(stage.name,): stage.depth() for stage in STAGES})
+
+# Put on a worker's queue to stop it once the items before it are handled
+STOP: object = object()
+
+
+class Stage:
+    """
+    Worker threads handling the items of one pipeline stage. Every worker has its own bounded queue and items with
+    the same key always go to the same worker, so the items of a path are handled in order in every stage. put blocks
+    while the worker's queue is full, which holds back the previous stage. on_idle is called by a worker whenever its
+    queue runs empty and before it stops
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], None], workers: int, queue_size: int, on_idle: Callable[[], None] | None = None):
+        self.name: str = name
+
+        self.__handler: Callable[[Any], None] = handler
+        self.__on_idle: Callable[[], None] | None = on_idle
+        self.__queues: List[queue.Queue] = [queue.Queue(maxsize=max(1, queue_size//workers)) for _ in range(workers)]
+        self.__threads: List[threading.Thread] = [
+            threading.Thread(target=self.__work, args=(q,), name=f"{name}-{i}", daemon=True) for i, q in enumerate(self.__queues)
+        ]
+        for thread in self.__threads:
+            thread.start()
+
+        STAGES.append(self)
+
+    def put(self, key: str, item: Any) -> None:
+        self.__queues[zlib.crc32(key.encode()) % len(self.__queues)].put(item)
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.__queues)
+
+    def __idle(self) -> None:
+        if self.__on_idle is None:
+            return
+        try:
+            self.__on_idle()
+        except Exception as e:
+            print(Fore.RED + f"[ERROR]: {self.name} stage failed: {e}")
+
+    def __work(self, q: queue.Queue) -> None:
+        while True:
+            if q.empty():
+                self.__idle()
+
+            item: Any = q.get()
+            if item is STOP:
+                self.__idle()
+                return
+
+            try:
+                with STAGE_SECONDS.time((self.name,)):
+                    self.__handler(item)
+            except Exception as e:
+                print(Fore.RED + f"[ERROR]: {self.name} stage failed: {e}")
+
+    def stop(self) -> None:
+        """
+        Handle every queued item and stop the workers
+        """
+        for q in self.__queues:
+            q.put(STOP)
+        for thread in self.__threads:
+            thread.join()
+        STAGES.remove(self)
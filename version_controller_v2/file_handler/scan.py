@@ -0,0 +1,104 @@
+from typing import Dict, List, Tuple
+import hashlib
+import os
+import time
+
+import xxhash
+
+from colorama import Fore
+
+from file_handler.update_batch import timed_encode_file
+
+# Files are hashed a block at a time instead of being read whole
+HASH_BLOCK_SIZE: int = 1 << 20
+
+# A file written within this long before its object was stored can change again without its mtime moving on
+# file systems with coarse timestamps, its stat isn't trusted and its contents are hashed again
+RACY_NS: int = 2_000_000_000
+
+STAT_KEYS: Tuple[str, ...] = ("size", "mtime_ns", "inode")
+
+def file_stat(file_path: str) -> Dict:
+    st: os.stat_result = os.stat(file_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+def stat_unchanged(obj: Dict | None, stat: Dict) -> bool:
+    if obj is None or any(obj.get(key) != stat[key] for key in STAT_KEYS):
+        return False
+    return obj["mtime_ns"] < obj.get("checked_ns", 0) - RACY_NS
+
+def file_hashes(file_path: str, sha256: bool) -> Dict:
+    """
+    xxh3_128 of the file's bytes, plus SHA-256 when sha256 is set
+    """
+    xxh = xxhash.xxh3_128(seed=69)
+    sha = hashlib.sha256() if sha256 else None
+    with open(file_path, "rb") as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            xxh.update(block)
+            if sha is not None:
+                sha.update(block)
+
+    hashes: Dict = {"xxhash": xxh.hexdigest()}
+    if sha is not None:
+        hashes["sha256"] = sha.hexdigest()
+    return hashes
+
+def hashes_match(obj: Dict, hashes: Dict) -> bool:
+    # Objects stored without SHA-256 still match once it's turned on, and the other way around
+    return obj.get("xxhash") == hashes["xxhash"] and ("sha256" not in obj or "sha256" not in hashes or obj["sha256"] == hashes["sha256"])
+
+def check_file(file_path: str, obj: Dict | None, sha256: bool) -> Tuple[str, int, float, Dict | None, List[str] | None]:
+    """
+    Check a file against its stored object. Files whose size, mtime and inode match the object aren't read, the others
+    are hashed. Returns the status ("missing", "unchanged", "touched" when only its stat changed or "changed"), the
+    number of bytes hashed and the seconds it took, the object to store for "touched" and "changed" and the file's
+    lines when it changed
+    """
+    try:
+        stat: Dict = file_stat(file_path)
+        if stat_unchanged(obj, stat):
+            return "unchanged", 0, 0.0, None, None
+
+        checked_ns: int = time.time_ns()
+        start: float = time.perf_counter()
+        hashes: Dict = file_hashes(file_path, sha256)
+        hash_seconds: float = time.perf_counter() - start
+        file_details: Dict = {**hashes, **stat, "checked_ns": checked_ns, "path": file_path}
+        if obj is not None and obj.get("size") == stat["size"] and hashes_match(obj, hashes):
+            return "touched", stat["size"], hash_seconds, file_details, None
+
+        with open(file_path, "r") as file:
+            file_contents: List[str] = file.readlines()
+    except Exception as _:
+        return "missing", 0, 0.0, None, None
+
+    return "changed", stat["size"], hash_seconds, file_details, file_contents
+
+def scan_file(file_path: str, obj: Dict | None, sha256: bool) -> Tuple[str, int, float, Dict | None, Dict | None, float | None]:
+    """
+    Check a file against its stored object, runs in the startup scan's worker processes. Returns the status of
+    check_file or "failed" when the changed file couldn't be tokenized, the number of bytes hashed and the seconds it
+    took, the object to store, the file encoded for /update_batch when it changed and the seconds tokenizing took.
+    Timings are handed back since the metrics of worker processes aren't served
+    """
+    status, hashed_bytes, hash_seconds, file_details, file_contents = check_file(file_path, obj, sha256)
+    if status != "changed":
+        return status, hashed_bytes, hash_seconds, file_details, None, None
+
+    try:
+        encoded: Dict
+        tokenize_seconds: float
+        encoded, tokenize_seconds = timed_encode_file(file_path, file_contents) #type: ignore
+        return status, hashed_bytes, hash_seconds, file_details, encoded, tokenize_seconds
+    except Exception as e:
+        print(Fore.RED + f"[ERROR]: Couldn't tokenize file \"{file_path}\": {e}")
+        return "failed", hashed_bytes, hash_seconds, file_details, None, None
+
+def format_duration(seconds: float) -> str:
+    minutes: int
+    secs: int
+    minutes, secs = divmod(int(seconds), 60)
+    if minutes >= 60:
+        return f"{minutes//60}h{minutes%60:02d}m"
+    return f"{minutes}m{secs:02d}s"
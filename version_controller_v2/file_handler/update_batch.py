@@ -0,0 +1,142 @@
+from typing import Dict, List, Tuple
+from array import array
+import gzip
+import sys
+import time
+
+import msgpack
+import requests
+
+from tokenizer.tokenize import tokenize_lines_compact
+from manager.metrics import Counter, Histogram
+
+from colorama import Fore
+
+# Must match BATCH_VERSION of the inference controller's /update_batch endpoint
+BATCH_VERSION: int = 1
+
+SEND_SECONDS: Histogram = Histogram("grep_vc_http_send_seconds", "Latency of the requests sent to the inference controller", labels=("endpoint",))
+SEND_FAILURES: Counter = Counter("grep_vc_http_send_failures_total", "Requests to the inference controller that failed or were rejected", labels=("endpoint",))
+SENT_BYTES: Counter = Counter("grep_vc_http_sent_bytes_total", "Request body bytes sent to the inference controller", labels=("endpoint",))
+
+def __little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+def encode_file(file_path: str, file_contents: List[str]) -> Dict:
+    """
+    Tokenize a file into the columnar layout of /update_batch, token types are ids into the file's own vocabulary
+    under "token_types" until pack_update_batch merges the vocabularies of a batch. Runs in worker processes too
+    """
+    doc_tokens: List
+    code_list: List
+    doc_tokens, code_list = tokenize_lines_compact("".join(file_contents), file_contents)
+
+    token_type_ids: Dict[str, int] = {}
+    lines: array = array("I")
+    token_counts: array = array("I")
+    token_types: array = array("H")
+    token_strs: List[str] = []
+    positions: array = array("I")
+    for i, elem in enumerate(zip(doc_tokens, code_list)):
+        tokens, _ = elem
+        lines.append(i)
+        token_counts.append(len(tokens))
+        for token_type, token_str, start_row, start_col, end_row, end_col in tokens:
+            token_types.append(token_type_ids.setdefault(token_type, len(token_type_ids)))
+            token_strs.append(token_str)
+            positions.extend((start_row, start_col, end_row, end_col))
+
+    return {
+        "path": file_path,
+        "codes": [code.strip() for code in code_list],
+        "lines": __little_endian(lines),
+        "token_counts": __little_endian(token_counts),
+        "token_types": token_types,
+        "vocabulary": list(token_type_ids.keys()),
+        "token_strs": token_strs,
+        "positions": __little_endian(positions)
+    }
+
+def timed_encode_file(file_path: str, file_contents: List[str]) -> Tuple[Dict, float]:
+    """
+    encode_file and the seconds it took, worker processes hand their timings back since their metrics aren't served
+    """
+    start: float = time.perf_counter()
+    encoded: Dict = encode_file(file_path, file_contents)
+    return encoded, time.perf_counter() - start
+
+def encoded_size(encoded: Dict) -> int:
+    """
+    Rough size of an encoded file in the payload
+    """
+    return sum(len(code) for code in encoded["codes"]) + len(encoded["positions"]) + 2*len(encoded["token_types"])
+
+def pack_update_batch(proj_dir: str, encoded: List[Dict]) -> bytes:
+    """
+    One msgpack payload for /update_batch, the files' token type ids are remapped into a vocabulary shared by the batch
+    """
+    token_type_ids: Dict[str, int] = {}
+    files: List[Dict] = []
+    for file in encoded:
+        remap: List[int] = [token_type_ids.setdefault(token_type, len(token_type_ids)) for token_type in file["vocabulary"]]
+        files.append({
+            **{key: value for key, value in file.items() if key != "vocabulary"},
+            "token_types": __little_endian(array("H", [remap[token_type] for token_type in file["token_types"]]))
+        })
+
+    return msgpack.packb({
+        "version": BATCH_VERSION,
+        "dir": proj_dir,
+        "token_types": list(token_type_ids.keys()),
+        "files": files
+    }, use_bin_type=True)
+
+def compress(payload: bytes, compression: str | None) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Compress the payload with gzip or zstd, zstd falls back to gzip when the zstandard package isn't installed.
+    Returns the body and its headers
+    """
+    headers: Dict[str, str] = {"Content-Type": "application/msgpack"}
+    if compression == "zstd":
+        try:
+            import zstandard
+            headers["Content-Encoding"] = "zstd"
+            return zstandard.ZstdCompressor().compress(payload), headers
+        except ImportError:
+            print(Fore.YELLOW + "[WARNING]: zstandard isn't installed, compressing update batches with gzip")
+            compression = "gzip"
+    if compression == "gzip":
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(payload, compresslevel=6), headers
+    return payload, headers
+
+def send_encoded_batch(url: str, proj_dir: str, encoded: List[Dict], compression: str | None) -> List[str]:
+    """
+    Send already encoded files to the inference controller in one /update_batch request. Returns the paths that were accepted
+    """
+    if len(encoded) == 0:
+        return []
+    paths: List[str] = [file["path"] for file in encoded]
+
+    body: bytes
+    headers: Dict[str, str]
+    body, headers = compress(pack_update_batch(proj_dir, encoded), compression)
+
+    SENT_BYTES.inc(len(body), ("/update_batch",))
+    try:
+        with SEND_SECONDS.time(("/update_batch",)):
+            response: requests.Response = requests.post(f"{url}/update_batch", data=body, headers=headers)
+    except Exception as e:
+        SEND_FAILURES.inc(1, ("/update_batch",))
+        print(Fore.RED + f"[ERROR]: Request error: {e}")
+        return []
+
+    if response.status_code not in (200, 202):
+        SEND_FAILURES.inc(1, ("/update_batch",))
+        print(Fore.RED + f"[ERROR]: Batch of {len(paths)} tokenized files couldn't be sent to server status code: {response.status_code}")
+        return []
+
+    print(Fore.GREEN + f"[SUCCESS]: Batch of {len(paths)} tokenized files sent to server ({len(body)} bytes)")
+    return paths
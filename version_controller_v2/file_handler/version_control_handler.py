@@ -1,17 +1,31 @@
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import os
+import threading
+import time
 import shutil
 import requests
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
-import xxhash
-import hashlib
-import json 
-import pickle
 from pprint import pprint
 
 from colorama import Fore
 
-from tokenizer.tokenize import tokenize_lines
+from manager.load_config import CONFIG
+from file_handler.update_batch import timed_encode_file, encoded_size, pack_update_batch, send_encoded_batch, SEND_SECONDS, SEND_FAILURES
+from file_handler.scan import check_file, format_duration, scan_file
+from file_handler.object_store import ObjectStore, migrate_object_cache
+from file_handler.debouncer import Debouncer
+from file_handler.pipeline import Stage
+from manager.metrics import Counter, Histogram
+
+EVENTS: Counter = Counter("grep_vc_events_total", "File system events received for python files", labels=("event",))
+FILES_HASHED: Counter = Counter("grep_vc_files_hashed_total", "Files read and hashed to check for changes")
+STAT_UNCHANGED: Counter = Counter("grep_vc_stat_unchanged_total", "Files not read because their size, mtime and inode matched their object")
+HASHED_BYTES: Counter = Counter("grep_vc_hashed_bytes_total", "Bytes of file contents hashed")
+HASH_SECONDS: Histogram = Histogram("grep_vc_hash_seconds", "Time spent hashing a file's contents")
+TOKENIZE_SECONDS: Histogram = Histogram("grep_vc_tokenize_seconds", "Time spent tokenizing a file")
+FILES_CHANGED: Counter = Counter("grep_vc_files_changed_total", "Hashed files whose contents changed and were sent to the server")
 
 class VersionControlHandler(FileSystemEventHandler):
     def __init__(self, proj_dir: str, verbose: bool =False):
@@ -19,42 +33,29 @@ class VersionControlHandler(FileSystemEventHandler):
 
         self.proj_dir: str = proj_dir
         self.grep_dir: str = os.path.join(proj_dir, ".grep++")
-        self.cache_dir: str = os.path.join(proj_dir, ".grep++", "object_cache")
-        self.obj_store_dir: str = os.path.join(self.cache_dir, "objects")
-        self.obj_index_path: str = os.path.join(self.cache_dir, "index.json")
+        self.obj_store_path: str = os.path.join(self.grep_dir, "objects.sqlite")
 
         self.__initialize_cache_dirs()
         self.grep_ignore: Set = self.__initialize_grep_ignore()
-        self.obj_index: Dict = self.__initialize_object_index()
-
-        self.__clean_orphaned_object_files()
-        self.obj_index = self.__update_project_objects()
-
-    def __clean_orphaned_object_files(self):
-        indexed_objs: Set = set(self.obj_index.keys())
-        for dirpath, _, filenames in os.walk(self.obj_store_dir):
-            for name in filenames:
-                obj_path: str = os.path.join(dirpath, name)
-                if obj_path not in indexed_objs:
-                    try:
-                        with open(obj_path, "rb") as file:
-                            obj: Dict = pickle.load(file)
-                        self.__send_file_deleted(obj["path"])
-                        os.remove(obj_path)
-                        print(Fore.GREEN + f"[SUCCESS] Cleaned orphaned object file \"{obj_path}\" reindexing and retokenizing will occur if file still in project")
-                    except Exception as e:
-                        print(Fore.RED + f"[ERROR] Couldn't clean up orphaned object file \"{obj_path}\" recommended reindexing and retokenizing whole project to avoid inconsistencies")
-                        print(e)
-
-    def __initialize_object_index(self) -> Dict:
-        try:
-            with open(self.obj_index_path, "r") as file:
-                obj_index: Dict = json.load(file)
-        except Exception as e:
-            print(Fore.YELLOW + "[WARNING]: Couldn't load index file \".grep++/object_cache/index.json\" file didn't exist or file corrupted. Recalculating object indexing")
-            obj_index: Dict = {}
-
-        return obj_index
+        self.obj_store: ObjectStore = ObjectStore(self.obj_store_path)
+        migrate_object_cache(self.obj_store, os.path.join(self.grep_dir, "object_cache"))
+
+        # Changes flow from the debouncer through the hash, tokenize and send stages, the observer thread only enqueues paths
+        self.__send_local: threading.local = threading.local()
+        self.__tokenize_pool: ProcessPoolExecutor | None = None
+        if CONFIG["PIPELINE"]["TOKENIZE"]["EXECUTOR"] == "process":
+            self.__tokenize_pool = ProcessPoolExecutor(CONFIG["PIPELINE"]["TOKENIZE"]["WORKERS"], mp_context=multiprocessing.get_context("spawn"))
+
+        self.send_stage: Stage = Stage("send", self.__send_change, CONFIG["PIPELINE"]["SEND"]["WORKERS"], CONFIG["PIPELINE"]["SEND"]["QUEUE_SIZE"], on_idle=self.__flush_send_batch)
+        self.tokenize_stage: Stage = Stage("tokenize", self.__tokenize_change, CONFIG["PIPELINE"]["TOKENIZE"]["WORKERS"], CONFIG["PIPELINE"]["TOKENIZE"]["QUEUE_SIZE"])
+        self.hash_stage: Stage = Stage("hash", self.__hash_change, CONFIG["PIPELINE"]["HASH"]["WORKERS"], CONFIG["PIPELINE"]["HASH"]["QUEUE_SIZE"])
+        self.debouncer: Debouncer = Debouncer(self.__enqueue_changes, CONFIG["DEBOUNCE"]["WINDOW_MS"]/1000, CONFIG["DEBOUNCE"]["MAX_DELAY_MS"]/1000)
+
+        # Paths with file system events since the startup scan began, the live pipeline owns them from then on
+        self.__scanning: bool = False
+        self.__live_paths: Set[str] = set()
+        self.__stop_scan: threading.Event = threading.Event()
+        self.__scan_thread: threading.Thread | None = None
 
     def __initialize_grep_ignore(self):
         if not os.path.exists(os.path.join(self.proj_dir, ".grepignore")):
@@ -70,154 +71,127 @@ class VersionControlHandler(FileSystemEventHandler):
             print(Fore.BLUE + "[NOTIFICATION]: Creating \".grep++\" directory")
             os.makedirs(self.grep_dir)
 
-        if not os.path.exists(self.cache_dir):
-            print(Fore.BLUE + "[NOTIFICATION]: Creating \".grep++/object_cache directory\"")
-            os.makedirs(self.cache_dir)
-
-        if not os.path.exists(self.obj_store_dir):
-            os.makedirs(self.obj_store_dir)
-            print(Fore.BLUE + f"[NOTIFICATION]: Creating object store directory \"{self.obj_store_dir}\"")
-
         return
 
-    def __update_project_objects(self) -> Dict:
-        new_obj_index: Dict = {}
-
-        # Update existing objects
-        for file_path in self.obj_index:
-            obj_path: str = os.path.join(self.obj_store_dir, self.obj_index[file_path])
-
-            try:
-                with open(obj_path, "rb") as file:
-                    obj: Dict = pickle.load(file)
-            except Exception as _:
-                print(Fore.YELLOW + f"[WARNING]: \"{obj_path}\" file's object couldn't be loaded. Retokenizing and reindexing")
-                obj: Dict = {"size": 0, "sha256": "", "xxhash": "", "path": ""}
-            
-            indexed: bool = self.__index_object(obj, file_path, obj_path)
-            if indexed:
-                new_obj_index[file_path] = self.obj_index[file_path]
-
-        # Iterate over directory files and check for new files that need to be indexed
+    def __ignored(self, file_path: str) -> bool:
+        for grep_ignore in self.grep_ignore:
+            if file_path.startswith(grep_ignore):
+                return True
+        return False
+
+    def __project_files(self) -> List[str]:
+        file_paths: List[str] = []
         for dirpath, _, filenames in os.walk(self.proj_dir):
             for name in filenames:
-                if not name.endswith(".py"):
-                    continue
-
                 file_path: str = os.path.join(dirpath, name)
+                if name.endswith(".py") and not self.__ignored(file_path):
+                    file_paths.append(file_path)
+        return file_paths
+
+    def start_scan(self) -> None:
+        """
+        Bring every file up to date with the server in the background, call once the observer is running so no edit
+        made during the scan is missed
+        """
+        self.__scanning = True
+        self.__scan_thread = threading.Thread(target=self.__scan_project, name="startup-scan", daemon=True)
+        self.__scan_thread.start()
+
+    def __live_changes_waiting(self) -> bool:
+        return self.debouncer.pending() > 0 or self.hash_stage.depth() > 0 or self.tokenize_stage.depth() > 0
+
+    def __scan_project(self) -> None:
+        """
+        Hash and tokenize the project's files in a process pool, a chunk at a time. Changes reported by the observer
+        are handled first, the scan waits while any are queued
+        """
+        file_paths: List[str] = self.__project_files()
+        workers: int = CONFIG["SCAN"]["WORKERS"] or os.cpu_count() or 1
+        chunk_files: int = CONFIG["SCAN"]["CHUNK_FILES"]
+        sha256: bool = CONFIG["CHANGE_DETECTION"]["SHA256"]
+
+        # Files deleted or ignored since the last run, files the observer saw created meanwhile aren't
+        for file_path in self.obj_store.delete_missing(file_paths + list(self.__live_paths)):
+            print(Fore.BLUE + f"[NOTIFICATION]: File removed since the last run \"{file_path}\"")
+            self.send_stage.put(file_path, ("scan_delete", file_path, None, None))
+
+        print(Fore.BLUE + f"[NOTIFICATION]: Scanning {len(file_paths)} files with {workers} workers")
+        start: float = time.monotonic()
+        last_progress: float = start
+        counts: Dict[str, int] = {"missing": 0, "unchanged": 0, "touched": 0, "changed": 0, "failed": 0}
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for chunk_start in range(0, len(file_paths), chunk_files):
+                while self.__live_changes_waiting() and not self.__stop_scan.is_set():
+                    time.sleep(0.05)
+                if self.__stop_scan.is_set():
+                    print(Fore.YELLOW + "[WARNING]: Startup scan stopped before it finished, the rest of the files are checked on the next start")
+                    break
 
-                ignore: bool = False
-                for grep_ignore in self.grep_ignore:
-                    if file_path.startswith(grep_ignore):
-                        ignore = True
-                        break
-
-                if ignore:
-                    continue
-
-                if file_path in new_obj_index:
-                    continue
-
-
-                print(Fore.BLUE + f"[NOTIFICATION]: Found new file in project directory \"{file_path}\"")
-                file_path_hash: str = self.__calculate_file_path_hash(file_path)
-                obj_path: str = os.path.join(self.obj_store_dir, file_path_hash)
-                indexed: bool = self.__index_object(None, file_path, obj_path)
-                if indexed:
-                    new_obj_index[file_path] = file_path_hash
-
-        with open(self.obj_index_path, "w") as file:
-            json.dump(new_obj_index, file, indent=1)
-
-        return new_obj_index
-            
-    def __calculate_file_path_hash(self, file_path: str) -> str:
-        return hashlib.sha256(file_path.encode()).hexdigest()
-
-    def __calculate_file_hashes(self, file_contents: str) -> Dict:
-        sha256_hash = hashlib.sha256(file_contents.encode()).hexdigest()
-        xxhash_hash = xxhash.xxh128(file_contents.encode(), seed=69).hexdigest()
-
-        return {"sha256": sha256_hash, "xxhash": xxhash_hash}
-
-    def __index_object(self, obj: Dict | None, file_path: str, obj_path: str) -> bool:
-        try:
-            with open(file_path, "r") as file:
-                file_contents = file.readlines()
-        except Exception as _:
-            print(Fore.BLUE + f"[NOTIFICATION]: File \"{file_path}\" doesn't exist or is unreadable. Removing from object store.")
-
-            if os.path.exists(obj_path):
-                os.remove(obj_path)
-
+                chunk: List[str] = file_paths[chunk_start:chunk_start+chunk_files]
+                objs: Dict[str, Dict] = self.obj_store.get_many(chunk)
+                # Files whose last change was never sent are checked as new files
+                chunk_objs: List[Dict | None] = [objs[file_path] if file_path in objs and objs[file_path]["sent"] else None for file_path in chunk]
+
+                results = pool.map(scan_file, chunk, chunk_objs, [sha256]*len(chunk), chunksize=max(1, len(chunk)//(4*workers)))
+                self.__apply_scan_results(chunk, list(results), counts)
+
+                now: float = time.monotonic()
+                done: int = min(chunk_start + chunk_files, len(file_paths))
+                if now - last_progress >= CONFIG["SCAN"]["PROGRESS_SECONDS"] or done == len(file_paths):
+                    last_progress = now
+                    rate: float = done/max(now - start, 1e-9)
+                    print(Fore.BLUE + f"[NOTIFICATION]: Scanned {done}/{len(file_paths)} files ({100*done//max(len(file_paths), 1)}%) {rate:.0f} files/s, ETA {format_duration((len(file_paths) - done)/max(rate, 1e-9))}")
+
+        self.__scanning = False
+        print(Fore.GREEN + f"[SUCCESS]: Startup scan done in {format_duration(time.monotonic() - start)}, {counts['changed']} changed, {counts['missing']} removed, {counts['unchanged'] + counts['touched']} unchanged, {counts['failed']} couldn't be tokenized")
+
+    def __apply_scan_results(self, chunk: List[str], results: List[Tuple[str, int, float, Dict | None, Dict | None, float | None]], counts: Dict[str, int]) -> None:
+        # Objects of files that changed and of files that were only touched, stored together before their updates are sent
+        changed: List[Dict] = []
+        touched: List[Dict] = []
+        updates: List[Tuple[str, Dict, str]] = []
+        for file_path, (status, hashed_bytes, hash_seconds, file_details, encoded, tokenize_seconds) in zip(chunk, results):
+            counts[status] += 1
+            self.__count_check(status, hashed_bytes, hash_seconds)
+            if tokenize_seconds is not None:
+                TOKENIZE_SECONDS.observe(tokenize_seconds)
+            if file_path in self.__live_paths or status == "unchanged":
+                continue
+
+            if status == "missing":
+                if self.__forget_object(file_path):
+                    self.send_stage.put(file_path, ("scan_delete", file_path, None, None))
+            elif status == "touched":
+                touched.append(file_details) #type: ignore
+            else:
+                changed.append(file_details) #type: ignore
+                if encoded is not None:
+                    updates.append((file_path, encoded, file_details["xxhash"])) #type: ignore
+
+        self.obj_store.put_many(changed, True)
+        self.obj_store.put_many(touched, False)
+        for file_path, encoded, xxhash in updates:
+            self.send_stage.put(file_path, ("scan_update", file_path, encoded, xxhash))
+
+    def __count_check(self, status: str, hashed_bytes: int, hash_seconds: float) -> None:
+        if status == "unchanged":
+            STAT_UNCHANGED.inc()
+        elif status != "missing":
+            FILES_HASHED.inc()
+            HASHED_BYTES.inc(hashed_bytes)
+            HASH_SECONDS.observe(hash_seconds)
+            if status != "touched":
+                FILES_CHANGED.inc()
+
+    def __forget_object(self, file_path: str) -> bool:
+        """
+        Remove the file's object, returns False when the file wasn't indexed
+        """
+        if not self.obj_store.delete(file_path):
             return False
 
-        file_hashes: Dict = self.__calculate_file_hashes("".join(file_contents))
-
-        if obj is not None and obj["size"] == os.path.getsize(file_path) and obj["sha256"] == file_hashes["sha256"] and obj["xxhash"] == file_hashes["xxhash"]:
-            return True
-
-
-        file_details: Dict = file_hashes
-        file_details["size"] = os.path.getsize(file_path)
-        file_details["path"] = file_path
-
-        with open(obj_path, "wb") as file:
-            pickle.dump(file_details, file)
-
-        if obj is not None:
-            self.__send_file_deleted(file_path)
-        self.__send_file_updated(file_contents, file_path)
-
-        print(Fore.GREEN + f"[SUCCESS]: Indexed file \"{file_path}\"")
-
-        return True
-
-    def __delete_object(self, file_path: str):
-        obj_path: str = os.path.join(self.obj_store_dir, self.obj_index[file_path])
-        os.remove(obj_path)
-        del self.obj_index[file_path]
-
         print(f"[SUCCESS]: Deleted indexed object \"{file_path}\"")
-
-        self.__send_file_deleted(file_path)
-
-    def __send_file_updated(self, file_contents: List[str], file_path: str) -> None:
-        code_lines: List = []
-        code_list: List
-        doc_tokens: List
-        doc_tokens, code_list = tokenize_lines("".join(file_contents), file_contents)
-        for i, elem in enumerate(zip(doc_tokens, code_list)):
-            tokens, code = elem
-            code_lines.append({
-                "tokens": tokens,
-                "code": code.strip(),
-                "line": i
-            })
-
-        try:
-            if self.verbose:
-                print(Fore.BLUE + "[NOTIFICATION]: Update request data:")
-                pprint({
-                    "dir": self.proj_dir,
-                    "path": file_path,
-                    "lines": code_lines
-                })
-            response: requests.Response = requests.post("http://127.0.0.1:8002/update", json={
-                "dir": self.proj_dir,
-                "path": file_path,
-                "lines": code_lines
-            })
-
-            if response.status_code == 200:
-                print(Fore.GREEN + f"[SUCCESS]: Tokenized file \"{file_path}\" sent to server")
-            else:
-                print(Fore.RED + f"[ERROR]: Tokenized file \"{file_path}\" couldn't be sent to server status code: {response.status_code}")
-        except Exception as e:
-            print(Fore.RED + f"[ERROR]: Request error: {e}")
-
-        return
-
+        return True
 
     def __send_file_deleted(self, file_path: str):
         try:
@@ -228,83 +202,205 @@ class VersionControlHandler(FileSystemEventHandler):
                     "path": file_path
                 })
 
-            response: requests.Response = requests.post("http://127.0.0.1:8002/delete", json={
-                "dir": self.proj_dir,
-                "path": file_path
-            })
+            with SEND_SECONDS.time(("/delete",)):
+                response: requests.Response = requests.post(f"{CONFIG['INFERENCE_CONTROLLER_URL']}/delete", json={
+                    "dir": self.proj_dir,
+                    "path": file_path
+                })
 
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 print(Fore.GREEN + "[SUCCESS]: File \"{file_path}\" sent to server for deletion")
             else:
+                SEND_FAILURES.inc(1, ("/delete",))
                 print(Fore.RED + f"[ERROR]: File \"{file_path}\" couldn't be sent to server for deletion, status code: {response.status_code}")
         except Exception as e:
+            SEND_FAILURES.inc(1, ("/delete",))
             print(Fore.RED + f"[ERROR]: Request error: {e}")
 
         return
 
 
-    def on_created(self, event: FileSystemEvent) -> None:
-        if not event.is_directory and event.src_path.endswith(".py"):
-            file_norm_path: str = os.path.normpath(event.src_path)
-            file_path: str = os.path.abspath(file_norm_path)
-
-            ignore: bool = False
-            for grep_ignore in self.grep_ignore:
-                if file_path.startswith(grep_ignore):
-                    ignore = True
-                    break
-            if ignore:
-                return super().on_created(event)
+    def __watched_path(self, src_path: str) -> str | None:
+        """
+        Absolute path of an event's python file, None for other files and ignored paths
+        """
+        if not src_path.endswith(".py"):
+            return None
+
+        file_path: str = os.path.abspath(os.path.normpath(src_path))
+        if self.__ignored(file_path):
+            return None
+
+        if self.__scanning:
+            self.__live_paths.add(file_path)
+        return file_path
+
+    def __enqueue_changes(self, actions: List[Tuple[str, str]]) -> None:
+        # Blocks while the hash stage is full, events keep being merged by the debouncer meanwhile
+        for file_path, action in actions:
+            self.hash_stage.put(file_path, (action, file_path))
+
+    def __hash_change(self, change: Tuple[str, str]) -> None:
+        """
+        Hash stage, read and hash updated files and pass on the ones whose contents changed
+        """
+        action: str
+        file_path: str
+        action, file_path = change
+
+        if action == "update":
+            print(Fore.BLUE + f"[NOTIFICATION]: File changed \"{file_path}\"")
+            # Compare against the stored object so saves that don't change the contents aren't sent again
+            status, hashed_bytes, hash_seconds, file_details, file_contents = check_file(file_path, self.obj_store.get(file_path), CONFIG["CHANGE_DETECTION"]["SHA256"])
+            self.__count_check(status, hashed_bytes, hash_seconds)
+
+            if status != "missing":
+                if file_details is not None:
+                    self.obj_store.put_many([file_details], status == "changed")
+                if file_contents is not None:
+                    # An update replaces every row of the file so no delete is needed first
+                    self.tokenize_stage.put(file_path, ("update", file_path, file_contents, file_details["xxhash"])) #type: ignore
+                return
+
+        # Deleted, or gone before it could be read
+        if self.__forget_object(file_path):
+            print(Fore.BLUE + f"[NOTIFICATION]: File deleted \"{file_path}\"")
+            self.tokenize_stage.put(file_path, ("delete", file_path, None, None))
+
+    def __tokenize_change(self, change: Tuple[str, str, List[str] | None, str | None]) -> None:
+        """
+        Tokenize stage, encode updated files for /update_batch in this thread or the process pool. Changes carry the
+        content hash of the file along so only the tokens of its current contents are stored once sent
+        """
+        action: str
+        file_path: str
+        file_contents: List[str] | None
+        xxhash: str | None
+        action, file_path, file_contents, xxhash = change
+
+        if action == "delete":
+            self.send_stage.put(file_path, (action, file_path, None, None))
+            return
 
-            print(Fore.BLUE + f"[NOTIFICATION]: File created \"{file_path}\"")
-            file_path_hash: str = self.__calculate_file_path_hash(file_path)
-            obj_path: str = os.path.join(self.obj_store_dir, file_path_hash)
-            if self.__index_object(None, file_path, obj_path):
-                self.obj_index[file_path] = file_path_hash
+        try:
+            encoded: Dict
+            tokenize_seconds: float
+            if self.__tokenize_pool is not None:
+                encoded, tokenize_seconds = self.__tokenize_pool.submit(timed_encode_file, file_path, file_contents).result()
+            else:
+                encoded, tokenize_seconds = timed_encode_file(file_path, file_contents) #type: ignore
+        except Exception as e:
+            print(Fore.RED + f"[ERROR]: Couldn't tokenize file \"{file_path}\": {e}")
+            return
+        # Observed here, the process pool's workers have their own registry
+        TOKENIZE_SECONDS.observe(tokenize_seconds)
+
+        self.send_stage.put(file_path, (action, file_path, encoded, xxhash))
+
+    def __send_batch(self) -> List[Tuple[Dict, str]]:
+        # Every send worker fills its own batch
+        if not hasattr(self.__send_local, "batch"):
+            self.__send_local.batch = []
+        return self.__send_local.batch
+
+    def __send_change(self, change: Tuple[str, str, Dict | None, str | None]) -> None:
+        """
+        Send stage, collect updated files into batches sent when full or when no more files are waiting
+        """
+        action: str
+        file_path: str
+        encoded: Dict | None
+        xxhash: str | None
+        action, file_path, encoded, xxhash = change
+
+        if action.startswith("scan_"):
+            # A live change of the path was read after the scan read it, and is sent instead. Deletes of files that are
+            # gone are still sent, the scan may have removed their object before the observer's delete got to it
+            if file_path in self.__live_paths and (action == "scan_update" or os.path.exists(file_path)):
+                return
+            action = action[len("scan_"):]
+
+        if action == "delete":
+            # Earlier updates of the path may still be in the batch
+            self.__flush_send_batch()
+            self.__send_file_deleted(file_path)
+            return
+
+        batch: List[Tuple[Dict, str]] = self.__send_batch()
+        batch.append((encoded, xxhash)) #type: ignore
+        if len(batch) >= CONFIG["UPDATE_BATCH"]["MAX_FILES"] or sum(encoded_size(file) for file, _ in batch) >= CONFIG["UPDATE_BATCH"]["MAX_BYTES"]:
+            self.__flush_send_batch()
+
+    def __flush_send_batch(self) -> None:
+        batch: List[Tuple[Dict, str]] = self.__send_batch()
+        if len(batch) == 0:
+            return
+
+        if self.verbose:
+            print(Fore.BLUE + f"[NOTIFICATION]: Update batch of {len(batch)} files:")
+            pprint([file["path"] for file, _ in batch])
+
+        sent: Set[str] = set(send_encoded_batch(CONFIG["INFERENCE_CONTROLLER_URL"], self.proj_dir, [file for file, _ in batch], CONFIG["UPDATE_BATCH"]["COMPRESSION"]))
+        # Files that couldn't be sent keep no tokens and are sent again by the next startup scan
+        tokens: Dict[str, Tuple[str, bytes]] = {}
+        for file, xxhash in batch:
+            if file["path"] in sent:
+                tokens[file["path"]] = (xxhash, pack_update_batch(self.proj_dir, [file]))
+            else:
+                print(Fore.RED + f"[ERROR]: Tokenized file \"{file['path']}\" couldn't be sent to server")
+        self.obj_store.put_tokens(tokens)
+        batch.clear()
+
+    def on_created(self, event: FileSystemEvent) -> None:
+        file_path: str | None = self.__watched_path(event.src_path) if not event.is_directory else None
+        if file_path is not None:
+            EVENTS.inc(1, ("created",))
+            self.debouncer.submit(file_path, "update")
 
         return super().on_created(event)
 
     def on_deleted(self, event: FileSystemEvent) -> None:
-        if not event.is_directory and event.src_path.endswith(".py"):
-            file_norm_path: str = os.path.normpath(event.src_path)
-            file_path: str = os.path.abspath(file_norm_path)
-
-            ignore: bool = False
-            for grep_ignore in self.grep_ignore:
-                if file_path.startswith(grep_ignore):
-                    ignore = True
-                    break
-            if ignore:
-                return super().on_created(event)
+        file_path: str | None = self.__watched_path(event.src_path) if not event.is_directory else None
+        if file_path is not None:
+            EVENTS.inc(1, ("deleted",))
+            self.debouncer.submit(file_path, "delete")
 
-            self.__delete_object(file_path)
-
-        return super().on_created(event)
+        return super().on_deleted(event)
 
     def on_modified(self, event: FileSystemEvent) -> None:
-        if not event.is_directory and event.src_path.endswith(".py"):
-            file_norm_path: str = os.path.normpath(event.src_path)
-            file_path: str = os.path.abspath(file_norm_path)
-
-            ignore: bool = False
-            for grep_ignore in self.grep_ignore:
-                if file_path.startswith(grep_ignore):
-                    ignore = True
-                    break
-            if ignore:
-                return super().on_created(event)
-
-            print(Fore.BLUE + f"[NOTIFICATION]: File modified \"{file_path}\"")
-
-
-            file_path_hash: str = self.__calculate_file_path_hash(file_path)
-            obj_path: str = os.path.join(self.obj_store_dir, file_path_hash)
-            if self.__index_object({"size": 0, "sha256": "", "xxhash": "", "path": ""}, file_path, obj_path):
-                self.obj_index[file_path] = file_path_hash
-
-        return super().on_created(event)
+        file_path: str | None = self.__watched_path(event.src_path) if not event.is_directory else None
+        if file_path is not None:
+            EVENTS.inc(1, ("modified",))
+            self.debouncer.submit(file_path, "update")
+
+        return super().on_modified(event)
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        # Editors save by writing a temporary file and renaming it over the original
+        if not event.is_directory:
+            src_path: str | None = self.__watched_path(event.src_path)
+            dest_path: str | None = self.__watched_path(event.dest_path)
+            if src_path is not None or dest_path is not None:
+                EVENTS.inc(1, ("moved",))
+            if src_path is not None:
+                self.debouncer.submit(src_path, "delete")
+            if dest_path is not None:
+                self.debouncer.submit(dest_path, "update")
+
+        return super().on_moved(event)
 
     def handle_exit(self):
-        with open(self.obj_index_path, "w") as file:
-            json.dump(self.obj_index, file, indent=1)
-        print(Fore.GREEN + "[SUCCESS]: Exit handled, indexing saved")
+        self.__stop_scan.set()
+        if self.__scan_thread is not None:
+            self.__scan_thread.join()
+
+        # Stop front to back so every change still waiting makes it through the later stages
+        self.debouncer.stop()
+        self.hash_stage.stop()
+        self.tokenize_stage.stop()
+        self.send_stage.stop()
+        if self.__tokenize_pool is not None:
+            self.__tokenize_pool.shutdown()
+
+        self.obj_store.close()
+        print(Fore.GREEN + "[SUCCESS]: Exit handled, object store closed")
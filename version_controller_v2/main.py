@@ -4,6 +4,8 @@ import time
 from watchdog.observers import Observer
 
 from file_handler.version_control_handler import VersionControlHandler
+from manager.load_config import CONFIG
+from manager.metrics import start_http_server
 
 import colorama
 
@@ -14,6 +16,10 @@ def main():
 
     args = readArguments()
 
+    if CONFIG["METRICS"]["PORT"] is not None:
+        start_http_server(CONFIG["METRICS"]["HOST"], CONFIG["METRICS"]["PORT"])
+        print(f"Serving metrics on http://{CONFIG['METRICS']['HOST']}:{CONFIG['METRICS']['PORT']}/metrics")
+
     event_handler = VersionControlHandler(args.dir, verbose=True)
 
     atexit.register(event_handler.handle_exit)
@@ -23,6 +29,9 @@ def main():
     observer.start()
     print(f"Monitoring Directory: {args.dir}")
 
+    # Started after the observer so edits made while the project is scanned aren't missed
+    event_handler.start_scan()
+
     try:
         while True:
             time.sleep(1)
@@ -1,6 +1,6 @@
 import tokenize
 import io
-from typing import List
+from typing import List, Tuple
 
 # Define mappings for token types
 KEYWORDS = {
@@ -70,7 +70,10 @@ BOOLEAN = {
 }
 
 
-def tokenize_lines(doc: str, split_doc: List[str]):
+def tokenize_lines_compact(doc: str, split_doc: List[str]) -> Tuple[List[List[Tuple[str, str, int, int, int, int]]], List[str]]:
+    """
+    Tokenize a document into its logical lines, every token is a (token_type, token_str, start_row, start_col, end_row, end_col) tuple
+    """
     doc_tokens: List = []
     tokens: List = []
     code: List = []
@@ -83,9 +86,7 @@ def tokenize_lines(doc: str, split_doc: List[str]):
         if tokenize.tok_name[token.exact_type] == "NEWLINE":
             codeline: str = ""
             to = token.end[0]
-            print(split_doc)
             while fr <= to:
-                print(fr-1)
                 codeline += " " + split_doc[fr-1].strip()
                 fr += 1
 
@@ -108,11 +109,6 @@ def tokenize_lines(doc: str, split_doc: List[str]):
         elif token_type in PUNCTUATIONS:
             token_type_str =  PUNCTUATIONS[token_type]
 
-        tokens.append({
-            "token_type": token_type_str,
-            "token_str": token_string,
-            "start_pos": f"{token.start[0]},{token.start[1]}",
-            "end_pos": f"{token.end[0]},{token.end[1]}"
-        })
+        tokens.append((token_type_str, token_string, token.start[0], token.start[1], token.end[0], token.end[1]))
 
     return doc_tokens, code